@@ -0,0 +1,128 @@
+"""
+Check that the in-place `predict_into` path of a model config returns what
+`predict(budget_to_data(...))` returns, then compare the paths by latency and
+by the memory allocated per evaluation. Configs with a compiled
+`predict_kernel` are also measured with their NumPy fallback kernel.
+
+    python -m benchmarks.evaluation --model fast_model
+"""
+
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+from budget_optimizer.utils.model_helpers import load_module
+
+from model_settings.optimizer import PARITY_RTOL
+
+
+MODEL_DIR = Path(__file__).parent.parent / "model_settings" / "example_files"
+
+
+def random_budgets(model_path: Path, n: int, seed: int = 0) -> list[dict]:
+    model = load_module("model_config", model_path / "model_config.py").model_loader(
+        model_path
+    )
+    rng = np.random.default_rng(seed)
+    channels = list(model.data.data_vars)
+    return [dict(zip(channels, rng.uniform(0, 20, len(channels)))) for _ in range(n)]
+
+
+def _in_place(module, model_path: Path) -> callable:
+    model = module.model_loader(model_path)
+    buffers = {}
+    return lambda budget: module.predict_into(budget, model, buffers)
+
+
+def evaluation_paths(model_path: Path) -> dict:
+    """The ways a model config can evaluate a budget, without the prediction cache"""
+    config = model_path / "model_config.py"
+    module = load_module("model_config", config)
+    model = module.model_loader(model_path)
+    paths = {
+        "xarray": lambda budget: model.predict(module.budget_to_data(budget, model)),
+        "in_place": _in_place(module, model_path),
+    }
+    if hasattr(module, "predict_kernel") and hasattr(module, "_predict_ufuncs"):
+        # A separate copy of the module, so only this path loses the kernel
+        fallback = load_module("model_config", config)
+        fallback.predict_kernel = fallback._predict_ufuncs
+        paths["in_place_numpy"] = _in_place(fallback, model_path)
+    return paths
+
+
+def check_parity(paths: dict, budgets: list[dict]) -> float:
+    """Largest relative difference of any path from xarray, which must be tiny"""
+    largest = 0.0
+    for budget in budgets:
+        expected = paths["xarray"](budget)
+        for name, evaluate in paths.items():
+            actual = evaluate(budget)
+            xr.testing.assert_allclose(expected, actual, rtol=PARITY_RTOL)
+            largest = max(
+                largest, float(np.max(np.abs(actual / expected - 1)).item())
+            )
+    return largest
+
+
+def measure(evaluate, budgets: list[dict], repeats: int) -> dict:
+    evaluate(budgets[0])
+    latencies = []
+    for _ in range(repeats):
+        for budget in budgets:
+            start = time.perf_counter()
+            evaluate(budget)
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    peaks, blocks = [], []
+    for budget in budgets:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        evaluate(budget)
+        after = tracemalloc.take_snapshot()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        blocks.append(
+            sum(
+                stat.count_diff
+                for stat in after.compare_to(before, "lineno")
+                if stat.count_diff > 0
+            )
+        )
+    tracemalloc.stop()
+    return {
+        "median_latency_us": statistics.median(latencies) * 1e6,
+        "peak_bytes": statistics.median(peaks),
+        "retained_blocks": statistics.median(blocks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="fast_model")
+    parser.add_argument("--n", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    model_path = MODEL_DIR / args.model
+    budgets = random_budgets(model_path, args.n)
+    paths = evaluation_paths(model_path)
+    difference = check_parity(paths, budgets)
+    print(
+        f"{args.model}: {', '.join(paths)} agree for {args.n} budgets, "
+        f"largest relative difference {difference:.2e}"
+    )
+    results = {
+        name: measure(evaluate, budgets, args.repeats)
+        for name, evaluate in paths.items()
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Benchmarks of model predictions, optimizer throughput and API latency,
+written to a JSON file so that runs can be compared:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --baseline before.json
+
+Everything runs against SQLite or in-memory storage in a temporary directory,
+so no database server is needed. The API is the real app, with its optimizer
+workers, served through FastAPI's TestClient. With a baseline, the exit code
+is 1 if any metric got worse by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+import optuna
+
+from benchmarks.evaluation import (
+    MODEL_DIR,
+    check_parity,
+    evaluation_paths,
+    measure,
+    random_budgets,
+)
+from model_settings.optimizer import BudgetModel, create_optimizer
+from utils.storage import create_storage
+
+
+PACKAGES = ["numpy", "numba", "xarray", "optuna", "fastapi", "sqlalchemy"]
+# Metrics compared with a baseline, and whether a larger value is better
+METRICS = {
+    "median_us": False,
+    "p95_us": False,
+    "median_latency_us": False,
+    "peak_bytes": False,
+    "trials_per_second": True,
+}
+
+
+def latency(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "median_us": statistics.median(samples) * 1e6,
+        "p95_us": samples[min(int(0.95 * len(samples)), len(samples) - 1)] * 1e6,
+    }
+
+
+def timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _version(package: str) -> str | None:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def environment() -> dict:
+    """What a run depends on besides the code, to tell whether runs compare"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {package: _version(package) for package in PACKAGES},
+    }
+
+
+def benchmark_predict(model_name: str, n: int, seconds: float) -> dict:
+    """
+    Latency of `BudgetModel.predict` for new and for cached budgets, and of
+    every evaluation path of the model config without the cache. Slow models
+    are measured on fewer budgets, so each takes about `seconds` per pass.
+    """
+    model_path = MODEL_DIR / model_name
+    model = BudgetModel(model_name, "Revenue", model_path)
+    warm_up = timed(model.predict, random_budgets(model_path, 1, seed=1)[0])
+    n = max(2, min(n, int(seconds / max(warm_up, 1e-9))))
+    budgets = random_budgets(model_path, n)
+
+    model.cache.clear()
+    uncached = [timed(model.predict, budget) for budget in budgets]
+    cached = [timed(model.predict, budget) for budget in budgets]
+    paths = evaluation_paths(model_path)
+    return {
+        "uncached": latency(uncached),
+        "cached": latency(cached),
+        "max_relative_difference": check_parity(paths, budgets),
+        "paths": {
+            name: measure(evaluate, budgets, repeats=1)
+            for name, evaluate in paths.items()
+        },
+    }
+
+
+def benchmark_optimizer(
+    model_name: str, n_trials: int, n_jobs: list[int], storage: str, directory: Path
+) -> dict:
+    """
+    Trials per second of `BudgetOptimizer.optimize` with TPE at each number of
+    threads, on a fresh study and an empty prediction cache every time
+    """
+    model_path = MODEL_DIR / model_name
+    model = BudgetModel(model_name, "Revenue", model_path)
+    channels = list(random_budgets(model_path, 1)[0])
+    bounds = {channel: (1.0, 10.0) for channel in channels}
+    total = 5.0 * len(channels)
+
+    results = {}
+    for jobs in n_jobs:
+        if storage == "sqlite":
+            study_storage = create_storage(f"sqlite:///{directory}/optuna-{jobs}.db")
+        else:
+            study_storage = optuna.storages.InMemoryStorage()
+        model.cache.clear()
+        # The example optimizer config sits next to the example models
+        optimizer = create_optimizer(
+            study_storage, MODEL_DIR, model, n_concurrent_trials=jobs
+        )
+        seconds = timed(
+            optimizer.optimize,
+            bounds,
+            (total, total),
+            timeout=None,
+            n_trials=n_trials,
+            study_name=f"benchmark-{jobs}",
+            n_jobs=jobs,
+        )
+        trials = len(
+            optimizer.study.get_trials(
+                deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+            )
+        )
+        results[str(jobs)] = {
+            "trials": trials,
+            "seconds": seconds,
+            "trials_per_second": trials / seconds,
+            "best_value": optimizer.study.best_value,
+        }
+    return results
+
+
+def benchmark_endpoints(directory: Path, repeats: int, n_trials: int) -> dict:
+    """
+    Latency of the API endpoints, reading a scenario that has finished and
+    creating new ones while the workers optimize them in the background
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory / 'api.db'}"
+    os.environ.setdefault("OPTIMIZER_WORKERS", "1")
+    # Imported here so the other benchmarks do not need the API dependencies
+    from fastapi.testclient import TestClient
+
+    import main
+    from utils.budget_classes import ACCEPTED_CHANNELS
+
+    def scenario(name: str) -> dict:
+        channel = {"initial_budget": 10, "lower_bound": 5, "upper_bound": 15}
+        total = 10 * len(ACCEPTED_CHANNELS)
+        return {
+            "name": name,
+            **{key: channel for key in ACCEPTED_CHANNELS},
+            "Total Budget": {
+                "initial_budget": total,
+                "lower_bound": total,
+                "upper_bound": total,
+            },
+            "n_trials": n_trials,
+            "timeout": 1,
+        }
+
+    def request(client: TestClient, method: str, url: str, **kwargs) -> float:
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        if isinstance(response.json(), dict) and "Error" in response.json():
+            raise RuntimeError(f"{method} {url}: {response.json()['Error']}")
+        return elapsed
+
+    budget = {channel.lower().replace(" ", "_"): 10.0 for channel in ACCEPTED_CHANNELS}
+    reads = {
+        "list_scenarios": ("GET", "/budget_scenario"),
+        "scenario": ("GET", "/budget_scenario/benchmark"),
+        "settings": ("GET", "/budget_scenario/benchmark/settings"),
+        "best_trial": ("GET", "/budget_scenario/benchmark/best_trial"),
+        "status": ("GET", "/budget_scenario/benchmark/status"),
+        "summary": ("GET", "/budget_scenario/benchmark/summary"),
+        "queue": ("GET", "/queue"),
+        "models": ("GET", "/models"),
+    }
+
+    results = {}
+    with TestClient(main.app) as client:
+        results["create_first"] = latency(
+            [request(client, "POST", "/budget_scenario", json=scenario("benchmark"))]
+        )
+        deadline = time.monotonic() + 300
+        status = None
+        while status not in ("done", "error"):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The benchmark scenario is still {status}")
+            time.sleep(0.5)
+            status = client.get("/budget_scenario/benchmark/status").json()["benchmark"]
+
+        for name, (method, url) in reads.items():
+            request(client, method, url)
+            results[name] = latency(
+                [request(client, method, url) for _ in range(repeats)]
+            )
+
+        # The first prediction may miss the cache, the others hit it
+        results["predict_first"] = latency(
+            [request(client, "POST", "/predict", json=budget)]
+        )
+        results["predict_cached"] = latency(
+            [request(client, "POST", "/predict", json=budget) for _ in range(repeats)]
+        )
+        results["create"] = latency(
+            [
+                request(client, "POST", "/budget_scenario", json=scenario(f"new-{i}"))
+                for i in range(repeats)
+            ]
+        )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, path: str = "") -> list:
+    """Print the change of every metric and return those worse than `tolerance`"""
+    regressions = []
+    for key, value in results.items():
+        name = f"{path}.{key}" if path else key
+        if key not in baseline:
+            continue
+        if isinstance(value, dict) and isinstance(baseline[key], dict):
+            regressions += compare(value, baseline[key], tolerance, name)
+        elif key in METRICS and baseline[key]:
+            change = value / baseline[key] - 1
+            print(f"{name}: {baseline[key]:.4g} -> {value:.4g} ({change:+.1%})")
+            if (-change if METRICS[key] else change) > tolerance:
+                regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="The relative change of a metric that counts as a regression",
+    )
+    parser.add_argument(
+        "--skip", nargs="*", default=[], choices=["predict", "optimizer", "endpoints"]
+    )
+    parser.add_argument("--models", nargs="+", default=["fast_model", "slow_model"])
+    parser.add_argument("--budgets", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--optimizer-model", default="fast_model")
+    parser.add_argument("--n-trials", type=int, default=200)
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--storage",
+        nargs="+",
+        default=["sqlite", "memory"],
+        choices=["sqlite", "memory"],
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--scenario-trials", type=int, default=2)
+    args = parser.parse_args()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    results = {
+        "environment": environment(),
+        "arguments": {key: str(value) for key, value in vars(args).items()},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        if "predict" not in args.skip:
+            results["predict"] = {
+                model: benchmark_predict(model, args.budgets, args.seconds)
+                for model in args.models
+            }
+        if "optimizer" not in args.skip:
+            results["optimizer"] = {
+                storage: benchmark_optimizer(
+                    args.optimizer_model, args.n_trials, args.n_jobs, storage, directory
+                )
+                for storage in args.storage
+            }
+        if "endpoints" not in args.skip:
+            results["endpoints"] = benchmark_endpoints(
+                directory, args.repeats, args.scenario_trials
+            )
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+    if args.baseline is not None:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,73 @@
 # from __future__ import annotations as _annotations
+import asyncio
+import functools
+import json
 import os
-from pathlib import Path
-import traceback
-import multiprocessing as mp
-from typing import Annotated, List
+import time
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Annotated, Literal
 
 import fastapi
-from fastapi import HTTPException, Depends
-from model_settings.optimizer import revenue_model, create_optimizer
+from fastapi import HTTPException, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from model_settings.early_stopping import CANCELLED, PAUSED, STOP_REASON_ATTR
+from model_settings.model_registry import model_registry
+from model_settings.optimizer import create_search_space
+from model_settings.worker_pool import (
+    OptimizerPool,
+    TERMINAL_EVENTS,
+    frontier_totals,
+    scenario_bounds,
+)
 import optuna
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Field, Session, SQLModel, create_engine, select, Relationship
+from cachetools import LRUCache
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dotenv import load_dotenv
 
-from utils.budget_classes import BudgetScenario, ACCEPTED_CHANNELS, Budget
+from utils.budget_classes import (
+    BudgetScenario,
+    FrontierScenario,
+    ACCEPTED_CHANNELS,
+    Budget,
+)
+from utils.scheduler import QueueFullError
+from utils.storage import (
+    StudyMetadataCache,
+    async_url,
+    create_storage,
+    engine_kwargs,
+)
+from utils.tables import (
+    BudgetScenarioSettings,
+    BudgetSettings,
+    BestTrial,
+    FrontierPoint,
+    ScenarioBatch,
+    delete_scenario_statements,
+)
+from utils.study_summary import summarize_trials, FINISHED_STATES
+from utils.warm_start import best_allocations, prior_allocations
+from utils.trial_format import (
+    ARROW_MEDIA_TYPE,
+    columns_to_arrow,
+    compress,
+    trials_to_columns,
+)
 
 load_dotenv()
 
+EVENT_POLL_SECONDS = 0.25
+MAX_TRIAL_PAGE_SIZE = 5000
+KEEP_ALIVE_SECONDS = 15
+WARM_START_TRIALS = int(os.environ.get("WARM_START_TRIALS", 5))
+# How long deleting a running scenario waits for its workers to stop
+DELETE_STOP_TIMEOUT = float(os.environ.get("DELETE_STOP_TIMEOUT", 30))
+
 origins = ["http://localhost:8000", "http://localhost:8080", "http://docker.host.internal:8000", "http://0.0.0.0:8000"]
 
 if os.environ.get("ALLOWED_ORIGINS", ""):
@@ -33,170 +84,326 @@ app.add_middleware(
 )
 
 
-SECONDS_IN_MINUTE = 60
+async def get_session():
+    async with AsyncSession(app.state.async_engine, expire_on_commit=False) as session:
+        yield session
 
 
-def get_session():
-    with Session(app.state.engine) as session:
-        yield session
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+async def run_blocking(executor: Executor, fn, *args, **kwargs):
+    """Run a blocking call on a bounded executor instead of the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(fn, *args, **kwargs)
+    )
 
 
-class BudgetScenarioSettings(SQLModel, table=True):
-    __tablename__ = "budgetscenariosettings"
-    name: str = Field(primary_key=True)
-    # total_budget: float = Field(default=Field(..., ge=0))
-    budget: List["BudgetSettings"] = Relationship(
-        back_populates="budget_scenario", cascade_delete=True
+def _new_study(budget_scenario: BudgetScenario) -> None:
+    # Create the study up front so every worker attaches to the same one
+    study = optuna.create_study(
+        study_name=budget_scenario.name,
+        storage=app.state.storage,
+        direction="maximize",
+    )
+    app.state.study_metadata.invalidate(budget_scenario.name)
+    study.set_user_attr("n_workers", budget_scenario.n_workers)
+    study.set_user_attr("model_version", budget_scenario.model_version)
+    # Kept so the scenario can be resumed, even after a restart
+    study.set_user_attr(
+        "scenario", budget_scenario.model_dump(mode="json", by_alias=True)
     )
 
 
-class BudgetSettings(SQLModel, table=True):
-    id: int = Field(default=None, primary_key=True)
-    study_name: str = Field(index=True, foreign_key="budgetscenariosettings.name")
-    channel: str = Field(index=True)
-    initial_budget: float
-    lower_bound: float
-    upper_bound: float
-    budget_scenario: BudgetScenarioSettings = Relationship(back_populates="budget")
-
-
-class OptimizerProcess(mp.Process):
-    def __init__(self, url: str, budget_scenario: BudgetScenario, *args, **kwargs):
-        mp.Process.__init__(self, *args, **kwargs)
-        self.daemon = True
-        self.budget_scenario = budget_scenario
-        self.timeout = budget_scenario.timeout
-        self.n_trials = budget_scenario.n_trials
-        self.url = url
-        self._pconn, self._cconn = mp.Pipe()
-        self._exception = None
-
-    def run(self):
-        try:
-            print("Running...")
-            self._cconn.send("running")
-            _optimize(self.url, self.budget_scenario, self.timeout, self.n_trials)
-            print("Done")
-            self._cconn.send("done")
-
-        except Exception as e:
-            tb = traceback.format_exc()
-            self._cconn.send((e, tb))
-
-        # You can still rise this exception if you need to
-
-    def terminate(self):
-        print("Terminating...")
-        super().terminate()
-
-    def join(self):
-        print("Joining...")
-        super().join()
-
-    @property
-    def exception(self):
-        if self._pconn.poll():
-            self._exception = self._pconn.recv()
-        return self._exception
-
-
-def _optimize(
-    url,
-    budget_scenario: BudgetScenario,
-    timeout: int,
-    n_trials: int,
-    load_if_exists: bool = False,
-) -> None:
-    config_path = Path(__file__).parent / "model_settings/example_files"
-    optimizer = create_optimizer(url, config_path)
-    bounds = {
-        channel: (
-            getattr(budget_scenario, channel.lower().replace(" ", "_")).lower_bound,
-            getattr(budget_scenario, channel.lower().replace(" ", "_")).upper_bound,
-        )
-        for channel in ACCEPTED_CHANNELS
-    }
+def _create_study(budget_scenario: BudgetScenario) -> None:
+    if budget_scenario.name in app.state.study_metadata.study_names():
+        raise HTTPException(status_code=400, detail="Budget scenario already exists")
+    _new_study(budget_scenario)
+
+
+def _create_studies(budget_scenarios: list[BudgetScenario]) -> None:
+    """Create the studies of a batch, removing them again if any creation fails"""
+    created = []
+    try:
+        for budget_scenario in budget_scenarios:
+            _new_study(budget_scenario)
+            created.append(budget_scenario.name)
+    except Exception:
+        for name in created:
+            _delete_study(name)
+        raise
+
+
+def _scenario_settings(budget_scenario: BudgetScenario) -> BudgetScenarioSettings:
+    return BudgetScenarioSettings(
+        name=budget_scenario.name,
+        budget=[
+            BudgetSettings(
+                study_name=budget_scenario.name,
+                channel="total_budget",
+                initial_budget=budget_scenario.total_budget.initial_budget,
+                lower_bound=budget_scenario.total_budget.lower_bound,
+                upper_bound=budget_scenario.total_budget.upper_bound,
+            )
+        ]
+        + [
+            BudgetSettings(
+                study_name=budget_scenario.name,
+                channel=channel.lower().replace(" ", "_"),
+                initial_budget=getattr(
+                    budget_scenario, channel.lower().replace(" ", "_")
+                ).initial_budget,
+                lower_bound=getattr(
+                    budget_scenario, channel.lower().replace(" ", "_")
+                ).lower_bound,
+                upper_bound=getattr(
+                    budget_scenario, channel.lower().replace(" ", "_")
+                ).upper_bound,
+            )
+            for channel in ACCEPTED_CHANNELS
+        ],
+        best_trial=BestTrial(study_name=budget_scenario.name),
+        frontier=[
+            FrontierPoint(
+                study_name=budget_scenario.name, point=point, total_budget=total
+            )
+            for point, total in enumerate(frontier_totals(budget_scenario))
+        ]
+        if isinstance(budget_scenario, FrontierScenario)
+        else [],
+    )
 
+
+def _enqueue_warm_starts(
+    budget_scenario: BudgetScenario, best_budgets: list[tuple[str, dict[str, float]]]
+):
+    bounds = scenario_bounds(budget_scenario)
     constraints = (
         budget_scenario.total_budget.lower_bound,
         budget_scenario.total_budget.upper_bound,
     )
-    print(bounds, constraints)
-    optimizer.optimize(
+    allocations, sources = prior_allocations(
+        app.state.storage,
+        best_budgets,
+        budget_scenario.model_version,
         bounds,
-        constraints=constraints,
-        study_name=budget_scenario.name,
-        n_trials=n_trials,
-        n_jobs=1,
-        timeout=timeout * SECONDS_IN_MINUTE,
-        load_if_exists=load_if_exists,
+        constraints,
+        n_best=WARM_START_TRIALS,
     )
+    if not allocations:
+        return
+    study = optuna.study.load_study(
+        study_name=budget_scenario.name, storage=app.state.storage
+    )
+    # Gradient and surrogate solvers read queued budgets channel by channel
+    sampling = (
+        budget_scenario.sampling if budget_scenario.solver == "tpe" else "sequential"
+    )
+    search_space = create_search_space(bounds, constraints, sampling)
+    for budget in allocations:
+        study.enqueue_trial(search_space.params(budget), skip_if_exists=True)
+    study.set_user_attr("warm_started_from", sources)
 
 
-@app.post("/budget_scenario")
-async def create_budget_scenario(budget_scenario: BudgetScenario, session: SessionDep):
+async def _warm_start(budget_scenario: BudgetScenario, session: AsyncSession):
     """
-    Create a budget scenario
+    Queue the best budgets of earlier scenarios with overlapping bounds on the
+    same model as the first trials of a new study
     """
+    if not budget_scenario.warm_start or isinstance(budget_scenario, FrontierScenario):
+        return
+    best_budgets = (
+        await session.exec(best_allocations(scenario_bounds(budget_scenario)))
+    ).all()
+    best_budgets = [
+        (name, budget) for name, budget in best_budgets if name != budget_scenario.name
+    ]
+    if best_budgets:
+        await run_blocking(
+            app.state.io_executor, _enqueue_warm_starts, budget_scenario, best_budgets
+        )
+
+
+def _delete_study(name: str) -> None:
     try:
-        print(budget_scenario)
-        if budget_scenario.name in optuna.study.get_all_study_names(
-            storage=app.state.database_url
-        ):
-            raise HTTPException(
-                status_code=400, detail="Budget scenario already exists"
-            )
-        if budget_scenario.name in app.state.RUNNING_PROCESSES:
-            raise HTTPException(
-                status_code=400, detail="Budget scenario is already running"
-            )
+        optuna.study.delete_study(study_name=name, storage=app.state.storage)
+    finally:
+        app.state.study_metadata.invalidate(name)
+
 
-        app.state.RUNNING_PROCESSES[budget_scenario.name] = OptimizerProcess(
-            app.state.database_url, budget_scenario
+def _pin_model(budget_scenario: BudgetScenario) -> None:
+    """Pin a scenario to the active model unless it names a model version"""
+    try:
+        budget_scenario.model_version = model_registry.resolve(
+            budget_scenario.model_version
         )
-        app.state.RUNNING_PROCESSES[budget_scenario.name].start()
-
-        budget_scenario_setting = BudgetScenarioSettings(
-            name=budget_scenario.name,
-            budget=[
-                BudgetSettings(
-                    study_name=budget_scenario.name,
-                    channel="total_budget",
-                    initial_budget=budget_scenario.total_budget.initial_budget,
-                    lower_bound=budget_scenario.total_budget.lower_bound,
-                    upper_bound=budget_scenario.total_budget.upper_bound,
-                )
-            ]
-            + [
-                BudgetSettings(
-                    study_name=budget_scenario.name,
-                    channel=channel.lower().replace(" ", "_"),
-                    initial_budget=getattr(
-                        budget_scenario, channel.lower().replace(" ", "_")
-                    ).initial_budget,
-                    lower_bound=getattr(
-                        budget_scenario, channel.lower().replace(" ", "_")
-                    ).lower_bound,
-                    upper_bound=getattr(
-                        budget_scenario, channel.lower().replace(" ", "_")
-                    ).upper_bound,
-                )
-                for channel in ACCEPTED_CHANNELS
-            ],
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+
+
+async def _start_scenario(budget_scenario: BudgetScenario, session: AsyncSession):
+    print(budget_scenario)
+    if app.state.optimizer_pool.is_active(budget_scenario.name):
+        raise HTTPException(
+            status_code=400, detail="Budget scenario is already running"
         )
+    await run_blocking(app.state.io_executor, _pin_model, budget_scenario)
+    await run_blocking(app.state.io_executor, _create_study, budget_scenario)
+    await _warm_start(budget_scenario, session)
+
+    session.add(_scenario_settings(budget_scenario))
+    await session.commit()
+
+    # Submit once the settings exist so the workers can record best trials
+    try:
+        app.state.optimizer_pool.submit(budget_scenario)
+    except QueueFullError as e:
+        for statement in delete_scenario_statements(budget_scenario.name):
+            await session.exec(statement)
+        await session.commit()
+        await run_blocking(app.state.io_executor, _delete_study, budget_scenario.name)
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+@app.post("/budget_scenario")
+async def create_budget_scenario(budget_scenario: BudgetScenario, session: SessionDep):
+    """
+    Create a budget scenario
+    """
+    try:
+        await _start_scenario(budget_scenario, session)
+    except HTTPException:
+        # Rejections such as a full queue keep their status code
+        raise
+    except Exception as e:
+        return {"Error": str(e)}
+    return {"Optimizer started": budget_scenario.name}
 
-        session.add(budget_scenario_setting)
-        session.commit()
 
-        session.refresh(budget_scenario_setting)
+@app.post("/frontier")
+async def create_frontier(budget_scenario: FrontierScenario, session: SessionDep):
+    """
+    Create a budget scenario that is solved at `n_points` total budgets
+    between its total budget bounds, tracing revenue against total spend
+    """
+    try:
+        await _start_scenario(budget_scenario, session)
+    except HTTPException:
+        # Rejections such as a full queue keep their status code
+        raise
     except Exception as e:
         return {"Error": str(e)}
     return {"Optimizer started": budget_scenario.name}
 
 
+@app.get("/frontier/{name}")
+async def get_frontier(name: str, session: SessionDep):
+    """
+    Get the best revenue and allocation found at each total budget of a frontier
+    """
+    points = (
+        await session.exec(
+            select(FrontierPoint)
+            .where(FrontierPoint.study_name == name)
+            .order_by(FrontierPoint.point)
+        )
+    ).all()
+    if not points:
+        raise HTTPException(status_code=404, detail="Frontier not found")
+    return {
+        "name": name,
+        "status": app.state.optimizer_pool.status.get(name, "unknown"),
+        "total_budget": [point.total_budget for point in points],
+        "value": [point.value for point in points],
+        "budget": [point.budget for point in points],
+    }
+
+
+@app.post("/budget_scenarios/batch")
+async def create_budget_scenario_batch(
+    budget_scenarios: list[BudgetScenario], session: SessionDep
+):
+    """
+    Create several budget scenarios at once, e.g. the same channel bounds at
+    different total budgets. Either every scenario is started or none is.
+    """
+    if not budget_scenarios:
+        raise HTTPException(status_code=400, detail="The batch has no scenarios")
+
+    names = [budget_scenario.name for budget_scenario in budget_scenarios]
+    existing = set(
+        await run_blocking(app.state.io_executor, app.state.study_metadata.study_names)
+    )
+    conflicts = sorted(
+        {name for name in names if names.count(name) > 1}
+        | {
+            name
+            for name in names
+            if name in existing or app.state.optimizer_pool.is_active(name)
+        }
+    )
+    if conflicts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Budget scenarios already exist or are repeated: {conflicts}",
+        )
+
+    for budget_scenario in budget_scenarios:
+        await run_blocking(app.state.io_executor, _pin_model, budget_scenario)
+    await run_blocking(app.state.io_executor, _create_studies, budget_scenarios)
+    for budget_scenario in budget_scenarios:
+        await _warm_start(budget_scenario, session)
+
+    batch_id = uuid.uuid4().hex
+    session.add_all(
+        [_scenario_settings(budget_scenario) for budget_scenario in budget_scenarios]
+    )
+    # Flush the scenarios first so the batch rows can reference them
+    await session.flush()
+    session.add_all(
+        [ScenarioBatch(study_name=name, batch_id=batch_id) for name in names]
+    )
+    await session.commit()
+
+    try:
+        app.state.optimizer_pool.submit_many(budget_scenarios)
+    except QueueFullError as e:
+        for name in names:
+            for statement in delete_scenario_statements(name):
+                await session.exec(statement)
+        await session.commit()
+        for name in names:
+            await run_blocking(app.state.io_executor, _delete_study, name)
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"batch_id": batch_id, "budget_scenarios": names}
+
+
+@app.get("/budget_scenarios/batch/{batch_id}")
+async def get_budget_scenario_batch(batch_id: str, session: SessionDep):
+    """
+    Get the optimizer status and best value of every scenario in a batch
+    """
+    rows = (
+        await session.exec(
+            select(ScenarioBatch.study_name, BestTrial.value)
+            .join(BestTrial, BestTrial.study_name == ScenarioBatch.study_name)
+            .where(ScenarioBatch.batch_id == batch_id)
+        )
+    ).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {
+        "batch_id": batch_id,
+        "budget_scenarios": {
+            name: {
+                "status": app.state.optimizer_pool.status.get(name, "unknown"),
+                "best_value": value,
+            }
+            for name, value in rows
+        },
+    }
+
+
 @app.get("/budget_scenario")
 async def get_budget_scenarios():
     """
@@ -204,37 +411,113 @@ async def get_budget_scenarios():
     """
     try:
         return {
-            "budget_scenarios": optuna.study.get_all_study_names(
-                storage=app.state.database_url
+            "budget_scenarios": await run_blocking(
+                app.state.io_executor, app.state.study_metadata.study_names
             )
         }
     except Exception:
         return {"budget_scenarios": []}
 
 
+def _load_trials(
+    name: str, after: int, limit: int | None
+) -> tuple[list[optuna.trial.FrozenTrial], int | None]:
+    trials = optuna.study.load_study(
+        study_name=name, storage=app.state.storage
+    ).get_trials(deepcopy=False)
+
+    trials = [trial for trial in trials if trial.number > after]
+    next_cursor = None
+    if limit is not None and len(trials) > limit:
+        trials = trials[:limit]
+        next_cursor = trials[-1].number
+    return trials, next_cursor
+
+
+def _trials_response(
+    name: str,
+    trials: list[optuna.trial.FrozenTrial],
+    next_cursor: int | None,
+    format: str,
+    accept_encoding: str,
+) -> Response:
+    if format == "json":
+        return JSONResponse(
+            jsonable_encoder({name: trials, "next_cursor": next_cursor})
+        )
+
+    columns = trials_to_columns(trials)
+    if format == "arrow":
+        return Response(
+            columns_to_arrow(columns, {"name": name}),
+            media_type=ARROW_MEDIA_TYPE,
+            headers={"X-Next-Cursor": json.dumps(next_cursor)},
+        )
+
+    body, encoding = compress(
+        json.dumps(
+            {"name": name, "next_cursor": next_cursor, "columns": columns}
+        ).encode(),
+        accept_encoding,
+    )
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"Vary": "Accept-Encoding"}
+        | ({"Content-Encoding": encoding} if encoding else {}),
+    )
+
+
 @app.get("/budget_scenario/{name}")
-async def get_budget_scenario(name: str):
+async def get_budget_scenario(
+    name: str,
+    since_trial_number: int = -1,
+    cursor: int | None = None,
+    limit: Annotated[int | None, Query(ge=1, le=MAX_TRIAL_PAGE_SIZE)] = None,
+    format: Literal["json", "columnar", "arrow"] = "json",
+    accept_encoding: Annotated[str, Header()] = "",
+):
     """
-    Get a budget scenario by name
+    Get the trials of a budget scenario numbered above `since_trial_number`.
+    With `limit` set, trials are returned in pages: pass the returned
+    `next_cursor` as `cursor` to get the next page until it is null.
+
+    `format=columnar` returns one array per field (number, state, objective and
+    each channel) compressed with brotli or gzip, and `format=arrow` returns the
+    same columns as an Arrow IPC stream with the cursor in the X-Next-Cursor header.
     """
+    after = since_trial_number if cursor is None else cursor
     try:
-        return {
-            name: optuna.study.load_study(
-                study_name=name, storage=app.state.database_url
-            ).trials
-        }
+        trials, next_cursor = await run_blocking(
+            app.state.io_executor, _load_trials, name, after, limit
+        )
     except KeyError:
         raise HTTPException(status_code=404, detail="Budget scenario not found")
 
+    # Serializing thousands of trials is CPU bound, so keep it off the loop too
+    return await run_blocking(
+        app.state.io_executor,
+        _trials_response,
+        name,
+        trials,
+        next_cursor,
+        format,
+        accept_encoding,
+    )
+
 
 @app.get("/budget_scenario/{name}/settings")
 async def get_budget_scenario_settings(name: str, session: SessionDep):
     """
     Get the settings for a budget scenario
     """
-    scenario = session.get(BudgetScenarioSettings, name, populate_existing=True)
-    settings = session.exec(
-        select(BudgetSettings).where(BudgetSettings.study_name == name)
+    scenario = await session.get(
+        BudgetScenarioSettings, name, populate_existing=True
+    )
+    settings = (
+        await session.exec(
+            select(BudgetSettings).where(BudgetSettings.study_name == name)
+        )
     ).all()
 
     if scenario or settings:
@@ -242,45 +525,377 @@ async def get_budget_scenario_settings(name: str, session: SessionDep):
     raise HTTPException(status_code=404, detail="Budget scenario not found")
 
 
+def _load_best_trial(name: str) -> optuna.trial.FrozenTrial:
+    return optuna.study.load_study(
+        study_name=name, storage=app.state.storage
+    ).best_trial
+
+
 @app.get("/budget_scenario/{name}/best_trial")
-async def get_best_trial(name: str):
+async def get_best_trial(name: str, session: SessionDep):
     """
     Get the best trial for a budget scenario
     """
+    best_trial = await session.get(BestTrial, name)
+    if best_trial is None:
+        # Scenarios created before best trials were tracked
+        try:
+            return {
+                name: await run_blocking(app.state.io_executor, _load_best_trial, name)
+            }
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Budget scenario not found")
+    if best_trial.value is None:
+        raise HTTPException(status_code=404, detail="No completed trials yet")
+    return {name: best_trial}
+
+
+@app.get("/budget_scenario/{name}/status")
+async def get_budget_scenario_status(name: str):
+    """
+    Get the optimizer status (queued, running, pausing, paused, cancelling,
+    cancelled, done or error) of a budget scenario
+    """
+    if name not in app.state.optimizer_pool.status:
+        raise HTTPException(status_code=404, detail="Budget scenario not running")
+    return {name: app.state.optimizer_pool.status[name]}
+
+
+@app.get("/budget_scenario/{name}/events")
+async def stream_budget_scenario_events(
+    name: str,
+    since: int = -1,
+    last_event_id: Annotated[int | None, Header()] = None,
+):
+    """
+    Stream trial, best value and terminal (done, error, deleted, paused,
+    cancelled) events of a budget scenario as Server-Sent Events. Events newer
+    than `since`, or the Last-Event-ID header on reconnect, are replayed first.
+    """
+    if app.state.optimizer_pool.events_since(name, since) is None:
+        raise HTTPException(status_code=404, detail="Budget scenario not running")
+
+    async def event_stream():
+        last_id = last_event_id if last_event_id is not None else since
+        last_sent = time.monotonic()
+        while True:
+            events = app.state.optimizer_pool.events_since(name, last_id) or []
+            for event in events:
+                yield (
+                    f"id: {event['id']}\n"
+                    f"event: {event['event']}\n"
+                    f"data: {json.dumps(event['data'])}\n\n"
+                )
+                last_id = event["id"]
+                last_sent = time.monotonic()
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+            if time.monotonic() - last_sent > KEEP_ALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/budget_scenario/{name}/queue")
+async def get_budget_scenario_queue(name: str):
+    """
+    Get the queue position and estimated start time of a budget scenario
+    """
+    queue = app.state.optimizer_pool.queue_info()
+    for job in queue["running"] + queue["queued"]:
+        if job["scenario"] == name:
+            return {name: job}
+    raise HTTPException(status_code=404, detail="Budget scenario not queued")
+
+
+@app.get("/queue")
+async def get_queue():
+    """
+    Get the running optimizer jobs and the queued jobs in the order they will start
+    """
+    return app.state.optimizer_pool.queue_info()
+
+
+def _trial_counts(
+    storage: optuna.storages.BaseStorage, study_id: int
+) -> tuple[int, int]:
+    return (
+        storage.get_n_trials(study_id),
+        storage.get_n_trials(study_id, state=FINISHED_STATES),
+    )
+
+
+def _summarize_study(storage: optuna.storages.BaseStorage, study_id: int) -> dict:
+    trials = storage.get_all_trials(study_id, deepcopy=False)
+    feasible = [
+        trial.user_attrs["feasible"]
+        for trial in trials
+        if "feasible" in trial.user_attrs
+    ]
+    return summarize_trials(trials_to_columns(trials)) | {
+        "infeasible_fraction": 1 - sum(feasible) / len(feasible) if feasible else None,
+        "stop_reason": storage.get_study_user_attrs(study_id).get(STOP_REASON_ATTR),
+    }
+
+
+@app.get("/budget_scenario/{name}/summary")
+async def get_budget_scenario_summary(name: str):
+    """
+    Get trial counts by state, the best trial, the running best value,
+    per-channel ranges and quantiles, the fraction of budgets outside the
+    bounds and why the optimizer stopped early, if it did, of a budget
+    scenario. The summary is recomputed only when the number of trials or
+    finished trials changes.
+    """
+    storage = app.state.storage
+    try:
+        study_id = await run_blocking(
+            app.state.io_executor, app.state.study_metadata.study_id, name
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Budget scenario not found")
+
+    key = await run_blocking(app.state.io_executor, _trial_counts, storage, study_id)
+    cached = app.state.summary_cache.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    summary = {"name": name} | await run_blocking(
+        app.state.io_executor, _summarize_study, storage, study_id
+    )
+    app.state.summary_cache[name] = (key, summary)
+    return summary
+
+
+def _pending_trials(name: str) -> tuple[int, list[int]]:
+    study = optuna.study.load_study(study_name=name, storage=app.state.storage)
+    return study.user_attrs.get("n_workers", 1), [
+        trial.user_attrs.get("pending_trials", 0)
+        for trial in study.get_trials(deepcopy=False)
+    ]
+
+
+@app.get("/budget_scenario/{name}/parallelism")
+async def get_parallelism(name: str):
+    """
+    Report how often trials were suggested while other trials were still running.
+    A pending trial is one whose result the sampler could not take into account.
+    """
+    try:
+        n_workers, pending = await run_blocking(
+            app.state.io_executor, _pending_trials, name
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Budget scenario not found")
+
+    n_trials = len(pending)
     return {
-        name: optuna.study.load_study(name, storage=app.state.database_url).best_trial
+        name: {
+            "n_workers": n_workers,
+            "n_trials": n_trials,
+            "concurrent_fraction": (
+                sum(p > 0 for p in pending) / n_trials if n_trials else 0.0
+            ),
+            "mean_pending_trials": sum(pending) / n_trials if n_trials else 0.0,
+        }
     }
 
 
+def _stop_study(name: str, reason: str) -> None:
+    study = optuna.study.load_study(study_name=name, storage=app.state.storage)
+    if reason == PAUSED and "n_points" in study.user_attrs.get("scenario", {}):
+        raise HTTPException(
+            status_code=400, detail="Frontier sweeps can only be cancelled"
+        )
+    study.set_user_attr(STOP_REASON_ATTR, reason)
+
+
+async def _stop_scenario(name: str, reason: str, status: str) -> dict:
+    try:
+        await run_blocking(app.state.io_executor, _stop_study, name, reason)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Budget scenario not found")
+    app.state.summary_cache.pop(name, None)
+    return {name: app.state.optimizer_pool.stop(name, status)}
+
+
+@app.post("/budget_scenario/{name}/pause")
+async def pause_budget_scenario(name: str):
+    """
+    Pause a budget scenario. Its queued jobs are dropped and its running
+    workers stop after their current trial. Resume continues from the stored
+    trials.
+    """
+    if not app.state.optimizer_pool.is_active(name):
+        raise HTTPException(status_code=400, detail="Budget scenario is not running")
+    return await _stop_scenario(name, PAUSED, "paused")
+
+
+@app.post("/budget_scenario/{name}/cancel")
+async def cancel_budget_scenario(name: str):
+    """
+    Stop a running or paused budget scenario for good, keeping its trials
+    """
+    return await _stop_scenario(name, CANCELLED, "cancelled")
+
+
+def _resume_study(name: str) -> BudgetScenario:
+    """
+    Clear the stop reason of a study, queue the trials that were interrupted
+    again and return its scenario with the trials it has left
+    """
+    study = optuna.study.load_study(study_name=name, storage=app.state.storage)
+    if study.user_attrs.get(STOP_REASON_ATTR) == CANCELLED:
+        raise HTTPException(status_code=400, detail="Budget scenario was cancelled")
+    if "scenario" not in study.user_attrs or "n_points" in study.user_attrs["scenario"]:
+        raise HTTPException(
+            status_code=400, detail="Budget scenario cannot be resumed"
+        )
+    budget_scenario = BudgetScenario.model_validate(study.user_attrs["scenario"])
+
+    # Trials still running belonged to a worker that was stopped or killed
+    for trial in study.get_trials(
+        deepcopy=False, states=(optuna.trial.TrialState.RUNNING,)
+    ):
+        app.state.storage.set_trial_state_values(
+            trial._trial_id, optuna.trial.TrialState.FAIL
+        )
+        if trial.params:
+            study.enqueue_trial(trial.params, user_attrs={"requeued": trial.number})
+
+    n_trials = budget_scenario.n_trials - len(
+        study.get_trials(
+            deepcopy=False,
+            states=(
+                optuna.trial.TrialState.COMPLETE,
+                optuna.trial.TrialState.PRUNED,
+            ),
+        )
+    )
+    if n_trials <= 0:
+        raise HTTPException(
+            status_code=400, detail="Budget scenario has no trials left"
+        )
+    study.set_user_attr(STOP_REASON_ATTR, None)
+    return budget_scenario.model_copy(update={"n_trials": n_trials})
+
+
+@app.post("/budget_scenario/{name}/resume")
+async def resume_budget_scenario(name: str):
+    """
+    Resume a paused budget scenario, or one stopped by a restart, from its
+    stored trials with the trials it has left
+    """
+    if app.state.optimizer_pool.is_active(name):
+        raise HTTPException(
+            status_code=400, detail="Budget scenario is already running"
+        )
+    try:
+        budget_scenario = await run_blocking(
+            app.state.io_executor, _resume_study, name
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Budget scenario not found")
+    app.state.summary_cache.pop(name, None)
+
+    try:
+        app.state.optimizer_pool.submit(budget_scenario)
+    except QueueFullError as e:
+        await run_blocking(app.state.io_executor, _stop_study, name, PAUSED)
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"Optimizer resumed": name, "n_trials": budget_scenario.n_trials}
+
+
 @app.delete("/budget_scenario/{name}")
 async def delete_budget_scenario(name: str, session: SessionDep):
     """
-    Delete a budget scenario
+    Delete a budget scenario, cancelling it first if it is running
     """
     try:
-        optuna.study.delete_study(study_name=name, storage=app.state.database_url)
-
-        scenario = session.get(BudgetScenarioSettings, name)
-        if scenario:
-            session.delete(scenario)
-            session.commit()
+        if app.state.optimizer_pool.is_active(name):
+            # Stop the running workers at their next trial before their study
+            # disappears under them
+            await _stop_scenario(name, CANCELLED, "cancelled")
+            deadline = time.monotonic() + DELETE_STOP_TIMEOUT
+            while (
+                app.state.optimizer_pool.is_active(name)
+                and time.monotonic() < deadline
+            ):
+                await asyncio.sleep(0.2)
+        app.state.optimizer_pool.remove(name)
+        app.state.summary_cache.pop(name, None)
+        await run_blocking(app.state.io_executor, _delete_study, name)
+
+        for statement in delete_scenario_statements(name):
+            await session.exec(statement)
+        await session.commit()
         return {"Deleted": name}
     except KeyError:
         raise HTTPException(status_code=404, detail="Budget scenario not found")
 
 
+def _predict_total(budget: dict[str, float], model_version: str) -> float:
+    with model_registry.use(model_version) as model:
+        return model.predict(budget).sum(...).item()
+
+
 @app.post("/predict")
-async def predict_budget(budget: Budget):
+async def predict_budget(budget: Budget, model_version: str | None = None):
+    """
+    Predict the total revenue of a budget with the active model, or with
+    `model_version` if given
+    """
     budget_dict = {
         channel: getattr(budget, channel.lower().replace(" ", "_"))
         for channel in ACCEPTED_CHANNELS
     }
 
-    prediction: float = revenue_model.predict(budget_dict).sum(...).item()
+    try:
+        model_version = await run_blocking(
+            app.state.io_executor, model_registry.resolve, model_version
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+
+    prediction: float = await run_blocking(
+        app.state.predict_executor, _predict_total, budget_dict, model_version
+    )
 
     return {"prediction": prediction}
 
 
+@app.get("/predict/cache")
+async def get_prediction_cache():
+    """
+    Get the hit, miss and eviction counters of the prediction cache
+    """
+    return model_registry.cache.info()
+
+
+@app.get("/models")
+async def get_models():
+    """
+    Get the model versions found in the model directory, which one is
+    active, which are loaded and how many requests are using each
+    """
+    return await run_blocking(app.state.io_executor, model_registry.info)
+
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    """
+    Load a model version and make it the default for new scenarios and
+    predictions. Running scenarios keep the version they started with.
+    """
+    try:
+        await run_blocking(app.state.io_executor, model_registry.activate, version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    return {"Active model": version}
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(app.state.engine, checkfirst=False, echo=True)
 
@@ -294,7 +909,11 @@ async def startup():
     db = os.environ.get("POSTGRES_DB", "optimizer")
     port = os.environ.get("POSTGRES_PORT", 5432)
     host = os.environ.get("POSTGRES_HOST", 'localhost')
-    app.state.database_url = f"postgresql://{user}:{password}@{host}:{port}/{db}"
+    # Any SQLAlchemy URL, such as a SQLite file for local runs and benchmarks
+    app.state.database_url = os.environ.get(
+        "DATABASE_URL", f"postgresql://{user}:{password}@{host}:{port}/{db}"
+    )
+    async_database_url = async_url(app.state.database_url)
 
     try:
         app.state.engine = create_engine(app.state.database_url)
@@ -316,13 +935,43 @@ async def startup():
         con.close()
         app.state.engine = create_engine(app.state.database_url)
     SQLModel.metadata.create_all(app.state.engine, checkfirst=True)
-    app.state.RUNNING_PROCESSES = {}
+    app.state.async_engine = create_async_engine(
+        async_database_url, **engine_kwargs()
+    )
+    app.state.storage = create_storage(app.state.database_url)
+    app.state.study_metadata = StudyMetadataCache(
+        app.state.storage, ttl=float(os.environ.get("STUDY_METADATA_TTL", 5))
+    )
+    app.state.io_executor = ThreadPoolExecutor(
+        max_workers=int(os.environ.get("BLOCKING_IO_WORKERS", 16)),
+        thread_name_prefix="blocking-io",
+    )
+    # Threads rather than processes so predictions share the API's cache
+    app.state.predict_executor = ThreadPoolExecutor(
+        max_workers=int(os.environ.get("PREDICT_WORKERS", 4)),
+        thread_name_prefix="predict",
+    )
+    app.state.summary_cache = LRUCache(maxsize=256)
+    app.state.optimizer_pool = OptimizerPool(
+        app.state.database_url,
+        size=int(os.environ.get("OPTIMIZER_WORKERS", os.cpu_count())),
+        max_jobs_per_worker=int(os.environ.get("OPTIMIZER_MAX_JOBS_PER_WORKER", 20)),
+        max_concurrent=int(os.environ.get("OPTIMIZER_MAX_CONCURRENT", 0)) or None,
+        max_queued=int(os.environ.get("OPTIMIZER_MAX_QUEUED", 100)),
+    )
+    app.state.optimizer_pool.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    for name, process in app.state.RUNNING_PROCESSES.items():
-        process.terminate()
-        process.join()
-    app.state.RUNNING_PROCESSES = {}
+    # Pause the scenarios that are still running so they can be resumed
+    for name in app.state.optimizer_pool.active():
+        try:
+            await run_blocking(app.state.io_executor, _stop_study, name, PAUSED)
+        except (KeyError, HTTPException):
+            pass
+    app.state.optimizer_pool.shutdown()
+    app.state.io_executor.shutdown(wait=False, cancel_futures=True)
+    app.state.predict_executor.shutdown(wait=False, cancel_futures=True)
+    await app.state.async_engine.dispose()
     print("Shutdown")
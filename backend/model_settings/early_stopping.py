@@ -0,0 +1,114 @@
+import numpy as np
+import optuna
+from optuna.terminator import (
+    BestValueStagnationEvaluator,
+    StaticErrorEvaluator,
+    Terminator,
+)
+
+from utils.budget_classes import BudgetScenario
+
+
+STOP_REASON_ATTR = "stop_reason"
+PAUSED = "Paused"
+CANCELLED = "Cancelled"
+
+
+def stop_requested(study: optuna.Study) -> bool:
+    """Whether a stopping rule, a pause or a cancel stopped the study"""
+    return study.user_attrs.get(STOP_REASON_ATTR) is not None
+
+
+def _stop(study: optuna.Study) -> None:
+    try:
+        study.stop()
+    except RuntimeError:
+        # Outside `Study.optimize` the optimizer checks the stop reason itself
+        pass
+
+
+def stop_on_request(study: optuna.Study, trial: optuna.trial.FrozenTrial) -> None:
+    """Optuna callback that stops a study after the trial in which it was paused"""
+    if stop_requested(study):
+        _stop(study)
+
+
+class EarlyStopping:
+    """
+    Optuna callback that stops a study once the best value has improved by less
+    than `plateau_tolerance` (relative) over the last `plateau_window` completed
+    trials, once it reaches `target_value`, or once Optuna's terminator finds
+    no improvement for `stagnation_trials` trials.
+
+    The first rule that fires is stored as the study's `stop_reason` user attr,
+    which also stops every other worker on the same study at its next trial.
+    """
+
+    def __init__(
+        self,
+        plateau_window: int | None = None,
+        plateau_tolerance: float = 1e-4,
+        target_value: float | None = None,
+        stagnation_trials: int | None = None,
+    ):
+        self.plateau_window = plateau_window
+        self.plateau_tolerance = plateau_tolerance
+        self.target_value = target_value
+        self.terminator = (
+            Terminator(
+                improvement_evaluator=BestValueStagnationEvaluator(stagnation_trials),
+                error_evaluator=StaticErrorEvaluator(0),
+            )
+            if stagnation_trials is not None
+            else None
+        )
+
+    @classmethod
+    def from_scenario(cls, budget_scenario: BudgetScenario) -> "EarlyStopping | None":
+        """The stopping rules of a scenario, or None if it has none"""
+        if (
+            budget_scenario.plateau_window is None
+            and budget_scenario.target_value is None
+            and budget_scenario.stagnation_trials is None
+        ):
+            return None
+        return cls(
+            plateau_window=budget_scenario.plateau_window,
+            plateau_tolerance=budget_scenario.plateau_tolerance,
+            target_value=budget_scenario.target_value,
+            stagnation_trials=budget_scenario.stagnation_trials,
+        )
+
+    def reason(self, study: optuna.Study) -> str | None:
+        trials = study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+        )
+        if not trials:
+            return None
+        values = np.array(
+            [trial.values[0] for trial in sorted(trials, key=lambda t: t.number)]
+        )
+        best = values.max()
+
+        if self.target_value is not None and best >= self.target_value:
+            return f"Reached the target value {self.target_value:g}"
+        if self.plateau_window is not None and len(values) > self.plateau_window:
+            earlier = values[: -self.plateau_window].max()
+            if best - earlier <= self.plateau_tolerance * abs(earlier):
+                return (
+                    f"Improved by less than {self.plateau_tolerance:g} "
+                    f"over the last {self.plateau_window} trials"
+                )
+        if self.terminator is not None and self.terminator.should_terminate(study):
+            return "No improvement found by the Optuna terminator"
+        return None
+
+    def __call__(self, study: optuna.Study, trial: optuna.trial.FrozenTrial) -> None:
+        if trial.state != optuna.trial.TrialState.COMPLETE:
+            return
+        if not stop_requested(study):
+            reason = self.reason(study)
+            if reason is None:
+                return
+            study.set_user_attr(STOP_REASON_ATTR, reason)
+        _stop(study)
@@ -6,6 +6,40 @@ from budget_optimizer.utils.model_helpers import AbstractModel, BudgetType
 
 INITIAL_BUDGET: BudgetType = dict(a=2.0, b=3.0)
 
+# Channel, weight, exponent and half saturation point of each response curve
+SATURATION = [("a", 0.2, 2, np.exp(1)), ("b", 0.25, 4, np.exp(2))]
+WEIGHTS = np.array([weight for _, weight, _, _ in SATURATION])
+POWERS = np.array([power for _, _, power, _ in SATURATION])
+HALVES = np.array([half for _, _, _, half in SATURATION])
+
+
+def _predict_ufuncs(x, weights, powers, halves, out):
+    out.fill(1)
+    for c in range(len(x)):
+        powered = x[c] ** powers[c]
+        out += weights[c] * (powered / (powered + halves[c] ** powers[c]))
+    return np.exp(out, out=out)
+
+
+def _predict_loops(x, weights, powers, halves, out):
+    for t in range(x.shape[1]):
+        total = 1.0
+        for c in range(x.shape[0]):
+            powered = x[c, t] ** powers[c]
+            total += weights[c] * (powered / (powered + halves[c] ** powers[c]))
+        out[t] = np.exp(total)
+    return out
+
+
+try:
+    from numba import njit
+
+    # One pass over the data without temporaries, compiled on first use. Not
+    # cached on disk: the config is loaded by path, outside of `sys.modules`
+    predict_kernel = njit(_predict_loops)
+except ImportError:
+    predict_kernel = _predict_ufuncs
+
 
 class SimpleModel(AbstractModel):
     """
@@ -23,13 +57,21 @@ class SimpleModel(AbstractModel):
 
     def predict(self, x: xr.Dataset) -> xr.DataArray:
         x = x.copy()
-        x["prediction"] = np.exp(
-            1
-            + 0.2 * (x["a"] ** 2 / (x["a"] ** 2 + np.exp(1) ** 2))
-            + 0.25 * (x["b"] ** 4 / (x["b"] ** 4 + np.exp(2) ** 4))
-        )
+        prediction = 1
+        for channel, weight, power, half in SATURATION:
+            prediction = prediction + weight * (
+                x[channel] ** power / (x[channel] ** power + half**power)
+            )
+        x["prediction"] = np.exp(prediction)
         return x["prediction"]
 
+    def predict_array(self, x: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """
+        `predict` on raw arrays: `x` holds the channels in `SATURATION` order,
+        with shape (channels, time), and the prediction is written to `out`
+        """
+        return predict_kernel(x, WEIGHTS, POWERS, HALVES, out)
+
     def contributions(self, x: xr.Dataset) -> xr.Dataset:
         return x
 
@@ -41,6 +83,43 @@ def budget_to_data(budget: BudgetType, model: AbstractModel) -> xr.Dataset:
     return data
 
 
+def predict_into(
+    budget: BudgetType, model: AbstractModel, buffers: dict
+) -> xr.DataArray:
+    """
+    `model.predict(budget_to_data(budget, model))` computed in place in
+    `buffers`, which the caller keeps between calls and which are allocated
+    on the first one. The result is overwritten by the next call.
+    """
+    for key in budget:
+        if key not in INITIAL_BUDGET:
+            # Unknown channels are an error, as in `budget_to_data`
+            raise KeyError(key)
+    if not buffers:
+        template = model.data[SATURATION[0][0]]
+        # Raw arrays, since looking variables up in the Dataset costs more
+        # than the kernel itself
+        buffers["source"] = [model.data[key].values for key, *_ in SATURATION]
+        buffers["data"] = np.empty((len(SATURATION),) + template.shape)
+        buffers["prediction"] = xr.DataArray(
+            np.empty(template.shape),
+            coords=template.coords,
+            dims=template.dims,
+            name="prediction",
+        )
+        buffers["out"] = buffers["prediction"].values
+
+    data = buffers["data"]
+    for row, source, (key, *_) in zip(data, buffers["source"], SATURATION):
+        if key in budget:
+            np.multiply(budget[key] / INITIAL_BUDGET[key], source, out=row)
+        else:
+            np.copyto(row, source)
+
+    model.predict_array(data, buffers["out"])
+    return buffers["prediction"]
+
+
 def model_loader(path: Path) -> AbstractModel:
     rng = np.random.default_rng(42)
     data_a = xr.DataArray(
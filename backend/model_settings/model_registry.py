@@ -0,0 +1,159 @@
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from budget_optimizer.utils.model_classes import BaseBudgetModel
+
+from model_settings.optimizer import BudgetModel, model_version
+from utils.prediction_cache import PredictionCache
+
+
+MODEL_DIR = Path(os.environ.get("MODEL_DIR", Path(__file__).parent / "example_files"))
+# Memory-mapped model data shared by the API and the optimizer workers
+MODEL_DATA_DIR = Path(
+    os.environ.get("MODEL_DATA_DIR", Path(tempfile.gettempdir()) / "model_data")
+)
+
+
+class ModelRegistry:
+    """
+    Models in the subdirectories of `model_dir`, by version. A model is only
+    loaded the first time it is used, and up to `max_resident` versions stay
+    loaded besides the active one and those in use.
+
+    `use` pins a version for the duration of a `with` block, so a model is
+    never unloaded while a prediction or an optimization still needs it, and
+    `activate` loads a version and then makes it the default in one step.
+    """
+
+    def __init__(
+        self,
+        model_dir: Path,
+        default_model: str,
+        model_name: str,
+        model_kpi: str,
+        cache: PredictionCache,
+        max_resident: int = 2,
+        shared_data_dir: Path | None = None,
+    ):
+        self.model_dir = model_dir
+        self.model_name = model_name
+        self.model_kpi = model_kpi
+        self.cache = cache
+        self.max_resident = max_resident
+        self.shared_data_dir = shared_data_dir
+        self._paths: dict[str, Path] = {}
+        self._models: OrderedDict[str, BudgetModel] = OrderedDict()
+        self._refs: Counter[str] = Counter()
+        self._loading: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.active_version = model_version(model_dir / default_model)
+
+    def refresh(self) -> dict[str, Path]:
+        """Pick up model directories added since the last scan"""
+        configs = self.model_dir.glob(f"*/{BaseBudgetModel._FUNCTION_MODULE_NAME}")
+        paths = {model_version(config.parent): config.parent for config in configs}
+        with self._lock:
+            self._paths.update(paths)
+            return dict(self._paths)
+
+    def resolve(self, version: str | None = None) -> str:
+        """The version to use for `version`, raising `KeyError` if it is unknown"""
+        if version is None:
+            return self.active_version
+        if version not in self._paths and version not in self.refresh():
+            raise KeyError(version)
+        return version
+
+    def _load(self, version: str) -> BudgetModel:
+        with self._lock:
+            if version in self._models:
+                self._models.move_to_end(version)
+                return self._models[version]
+            loading = self._loading.setdefault(version, threading.Lock())
+        # Load outside the registry lock so other versions stay usable
+        with loading:
+            with self._lock:
+                if version in self._models:
+                    return self._models[version]
+            if version not in self._paths:
+                self.refresh()
+            model = BudgetModel(
+                self.model_name,
+                self.model_kpi,
+                self._paths[version],
+                cache=self.cache,
+                shared_data_dir=self.shared_data_dir,
+            )
+            with self._lock:
+                self._models[version] = model
+                self._evict()
+            return model
+
+    def _evict(self) -> None:
+        idle = [
+            version
+            for version in self._models
+            if self._refs[version] == 0 and version != self.active_version
+        ]
+        for version in idle[: max(len(idle) - self.max_resident, 0)]:
+            del self._models[version]
+
+    def preload(self, version: str | None = None) -> None:
+        """Load a version, the active one if None, ahead of its first use"""
+        self._load(self.resolve(version))
+
+    @contextmanager
+    def use(self, version: str | None = None) -> Iterator[BudgetModel]:
+        """Pin a version, the active one if None, while the block runs"""
+        version = self.resolve(version)
+        with self._lock:
+            self._refs[version] += 1
+        try:
+            yield self._load(version)
+        finally:
+            with self._lock:
+                self._refs[version] -= 1
+                if self._refs[version] == 0:
+                    del self._refs[version]
+                self._evict()
+
+    def activate(self, version: str) -> None:
+        """Load a version and make it the default for new scenarios and predictions"""
+        version = self.resolve(version)
+        self._load(version)
+        with self._lock:
+            self.active_version = version
+            self._evict()
+
+    def info(self) -> list[dict]:
+        paths = self.refresh()
+        with self._lock:
+            return [
+                {
+                    "version": version,
+                    "name": path.name,
+                    "active": version == self.active_version,
+                    "loaded": version in self._models,
+                    "in_use": self._refs[version],
+                }
+                for version, path in paths.items()
+            ]
+
+
+model_registry = ModelRegistry(
+    MODEL_DIR,
+    os.environ.get("MODEL_NAME", "slow_model"),
+    "Revenue Model",
+    "Revenue",
+    cache=PredictionCache(
+        maxsize=int(os.environ.get("PREDICTION_CACHE_SIZE", 1024)),
+        decimals=int(os.environ.get("PREDICTION_CACHE_DECIMALS", 6)),
+    ),
+    max_resident=int(os.environ.get("MODEL_REGISTRY_SIZE", 2)),
+    shared_data_dir=MODEL_DATA_DIR,
+)
@@ -1,30 +1,716 @@
 from budget_optimizer.utils.model_classes import BaseBudgetModel
+from budget_optimizer.utils.model_helpers import BudgetType, load_module
 from budget_optimizer.optimizer import OptunaBudgetOptimizer
+from budget_optimizer.utils.search_space_helper import ConstrainedSearchSpace
+import numpy as np
+import optuna
+import xarray as xr
+from scipy import optimize
 
 from pathlib import Path
+from typing import Callable, Literal
+import hashlib
+import math
+import os
+import threading
+import time
+
+from model_settings.early_stopping import stop_requested
+from model_settings.surrogate import GaussianProcess, expected_improvement
+from utils.allocation import (
+    budget_to_simplex,
+    is_feasible,
+    project_budget,
+    random_budgets,
+    simplex_to_budget,
+)
+from utils.prediction_cache import PredictionCache
+from utils.shared_data import share_dataset
+
+
+# Compiled kernels may round differently from NumPy in the last few bits
+PARITY_RTOL = 1e-9
+
+
+def model_version(model_path: Path) -> str:
+    """
+    Hash of the model config followed by the other files of a model directory,
+    so a retrained model gets a new version even if its code is unchanged
+    """
+    digest = hashlib.sha256(
+        (model_path / BaseBudgetModel._FUNCTION_MODULE_NAME).read_bytes()
+    )
+    for file in sorted(model_path.rglob("*")):
+        if (
+            file.is_file()
+            and file.name != BaseBudgetModel._FUNCTION_MODULE_NAME
+            and "__pycache__" not in file.parts
+        ):
+            digest.update(file.read_bytes())
+    return digest.hexdigest()[:12]
 
 
 class BudgetModel(BaseBudgetModel):
     """
-    Budget model class
+    Budget model class that memoizes predictions for plain budget dicts.
+
+    If `shared_data_dir` is set, the `data` Dataset of the loaded model is
+    moved to memory maps there, so processes loading the same model version
+    share its training arrays.
+
+    If the model config defines `predict_into(budget, model, buffers)`,
+    budget dicts are predicted in buffers kept per thread instead of new
+    datasets, and only the prediction is copied out for the cache. Such
+    configs usually hand the arrays to a compiled `predict_array` kernel of
+    the model, so the first budget is predicted both ways, and `predict` is
+    used from then on if they disagree. The verdict is kept next to the
+    shared data, so other processes loading the version skip the check.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_kpi: str,
+        model_path: str | Path,
+        cache: PredictionCache | None = None,
+        shared_data_dir: Path | None = None,
+    ):
+        super().__init__(model_name, model_kpi, model_path)
+        self.model_version = model_version(self.model_path)
+        self.cache = cache if cache is not None else PredictionCache()
+        self._predict_into = getattr(
+            load_module(
+                self._FUNCTION_MODULE_NAME.replace(".py", ""),
+                self.model_path / self._FUNCTION_MODULE_NAME,
+            ),
+            "predict_into",
+            None,
+        )
+        if shared_data_dir is not None and isinstance(
+            getattr(self._model, "data", None), xr.Dataset
+        ):
+            self._model.data = share_dataset(
+                self._model.data, shared_data_dir / self.model_version
+            )
+        self._buffers = threading.local()
+        self._verdict_path = (
+            shared_data_dir / f"{self.model_version}.predict_into"
+            if shared_data_dir is not None
+            else None
+        )
+        self._verified = False
+        if self._verdict_path is not None and self._verdict_path.exists():
+            self._verified = self._verdict_path.read_text() == "ok"
+            if not self._verified:
+                self._predict_into = None
+
+    def predict(self, budget: BudgetType) -> xr.DataArray:
+        """
+        Predict the target variable, reusing earlier predictions for the same budget.
+        The returned array may be shared with other callers and must not be modified.
+        """
+        if not isinstance(budget, dict):
+            return super().predict(budget)
+        return self.cache.get_or_compute(
+            budget, self.model_version, lambda: self._predict(budget)
+        )
+
+    def _predict_in_place(self, budget: dict[str, float]) -> xr.DataArray:
+        if not hasattr(self._buffers, "buffers"):
+            self._buffers.buffers = {}
+        # The buffers are reused by the next call, the cache keeps a copy
+        return self._predict_into(budget, self._model, self._buffers.buffers).copy()
+
+    def _record_verdict(self, verdict: str) -> None:
+        if self._verdict_path is None:
+            return
+        self._verdict_path.parent.mkdir(parents=True, exist_ok=True)
+        staging = self._verdict_path.with_suffix(f".{os.getpid()}")
+        staging.write_text(verdict)
+        # Renaming is atomic, so other processes never read a partial verdict
+        staging.replace(self._verdict_path)
+
+    def _check_predict_into(self, budget: dict[str, float]) -> xr.DataArray:
+        """`predict` for a budget, keeping `predict_into` only if it agrees"""
+        expected = super().predict(budget)
+        try:
+            actual = self._predict_in_place(budget)
+            xr.testing.assert_allclose(expected, actual, rtol=PARITY_RTOL)
+        except Exception as e:
+            print(f"predict_into failed for {self.model_name}, using predict: {e}")
+            self._predict_into = None
+            self._record_verdict("failed")
+        else:
+            self._verified = True
+            self._record_verdict("ok")
+        return expected
+
+    def _predict(self, budget: dict[str, float]) -> xr.DataArray:
+        if self._predict_into is not None and not self._verified:
+            return self._check_predict_into(budget)
+        if self._predict_into is not None:
+            try:
+                return self._predict_in_place(budget)
+            except Exception as e:
+                # Budgets that `predict` rejects too keep the in-place path
+                prediction = super().predict(budget)
+                print(f"predict_into failed for {self.model_name}, using predict: {e}")
+                self._predict_into = None
+                return prediction
+        return super().predict(budget)
+
+
+FINITE_DIFFERENCE_STEP = 1e-6
+
+
+class _SolverStopped(Exception):
+    """Raised inside the objective to stop a SciPy solver at its trial limit"""
+
+
+class SearchSpace(ConstrainedSearchSpace):
+    """
+    Constrained search space that tolerates floating point round-off when the
+    bounds leave a channel a single feasible value, e.g. when a queued budget
+    puts a channel exactly on its bound
+    """
+
+    def __call__(self, trial: optuna.Trial) -> dict[str, float]:
+        selected_budget = {}
+        bounds = list(self.bounds.items())
+        for n, (name, (low, high)) in enumerate(bounds):
+            spent = sum(selected_budget.values())
+            rest = [bound for _, bound in bounds[n + 1 :]]
+            low = max(low, self.constraint[0] - spent - sum(b[1] for b in rest))
+            high = min(high, self.constraint[1] - spent - sum(b[0] for b in rest))
+            if low > high and math.isclose(low, high, rel_tol=1e-9, abs_tol=1e-9):
+                low = high
+            selected_budget[name] = trial.suggest_float(name, low, high)
+        return selected_budget
+
+    def params(self, budget: dict[str, float]) -> dict[str, float]:
+        """Trial parameters that make this search space return `budget`"""
+        return budget
+
+
+class SimplexSearchSpace:
+    """
+    Search space over the budgets that meet both the channel bounds and the
+    total budget. The sampler picks a total and a weight per channel, which
+    `simplex_to_budget` spreads over the channels, so every parameter keeps
+    the same range from trial to trial and every budget is feasible.
+    """
+
+    def __init__(
+        self, bounds: dict[str, tuple[float, float]], constraint: tuple[float, float]
+    ):
+        self.bounds = bounds
+        self.constraint = constraint
+        self.total = (
+            max(constraint[0], sum(low for low, _ in bounds.values())),
+            min(constraint[1], sum(high for _, high in bounds.values())),
+        )
+
+    def __call__(self, trial: optuna.Trial) -> dict[str, float]:
+        total = self.total[0]
+        if self.total[1] > self.total[0]:
+            total = trial.suggest_float("total_budget", *self.total)
+        weights = {
+            name: trial.suggest_float(f"{name} weight", 0, 1) for name in self.bounds
+        }
+        return simplex_to_budget(total, weights, self.bounds)
+
+    def params(self, budget: dict[str, float]) -> dict[str, float]:
+        """Trial parameters that make this search space return `budget`"""
+        total, weights = budget_to_simplex(budget, self.bounds)
+        params = {f"{name} weight": weight for name, weight in weights.items()}
+        if self.total[1] > self.total[0]:
+            params["total_budget"] = total
+        return params
+
+
+def create_search_space(
+    bounds: dict[str, tuple[float, float]],
+    constraints: None | tuple,
+    sampling: Literal["sequential", "simplex"] = "sequential",
+) -> SearchSpace | SimplexSearchSpace:
+    """
+    Sequential sampling suggests the channels one by one within the range the
+    earlier channels leave; simplex sampling suggests a total and channel weights
     """
+    if constraints is None:
+        constraints = (-np.inf, np.inf)
+    if sampling == "simplex":
+        return SimplexSearchSpace(bounds, constraints)
+    return SearchSpace(bounds, constraints)
+
+
+class BudgetOptimizer(OptunaBudgetOptimizer):
+    """
+    Optuna budget optimizer that records how many trials were still running
+    when each trial was suggested, can evaluate candidates in batches, can
+    hand smooth models to a gradient-based SciPy solver and can screen
+    candidates for expensive models with a surrogate
+    """
+
+    def _record_pending(self, trial: optuna.Trial) -> None:
+        running = trial.study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.RUNNING,)
+        )
+        trial.set_user_attr("pending_trials", max(len(running) - 1, 0))
+
+    def _record_budget(self, trial: optuna.Trial, budget: dict[str, float]) -> None:
+        trial.set_user_attr("budget", budget)
+        trial.set_user_attr("total_budget", sum(budget.values()))
+        trial.set_user_attr(
+            "feasible",
+            is_feasible(budget, self.search_space.bounds, self.search_space.constraint),
+        )
+
+    def _opt_fn(self, trial):
+        self._record_pending(trial)
+        budget = self.search_space(trial)
+        self._record_budget(trial, budget)
+        prediction = self.model.predict(budget)
+        return -self._loss_fn(prediction, **self._config["loss_fn_kwargs"])
+
+    def _create_study(
+        self,
+        bounds: dict[str, tuple[float, float]],
+        constraints: None | tuple,
+        study_name: str,
+        load_if_exists: bool,
+        warm_starts: list[dict[str, float]] | None = None,
+        sampling: Literal["sequential", "simplex"] = "sequential",
+    ) -> None:
+        # The parent class keeps the storage, sampler and pruner name-mangled
+        self.study = optuna.create_study(
+            storage=self._OptunaBudgetOptimizer__storage,
+            study_name=study_name,
+            direction=self._direction,
+            sampler=self._OptunaBudgetOptimizer__sampler,
+            pruner=self._OptunaBudgetOptimizer__pruner,
+            load_if_exists=load_if_exists,
+        )
+        self.study.set_metric_names([self.objective_name])
+        self.search_space = create_search_space(bounds, constraints, sampling)
+        for budget in warm_starts or []:
+            self.study.enqueue_trial(
+                self.search_space.params(budget), skip_if_exists=True
+            )
+
+    def _batch_losses(self, budgets: list[dict[str, float]]) -> list[float]:
+        """Evaluate all budgets with a single predict call along a candidate dimension"""
+        candidates = xr.Dataset(
+            {
+                name: ("candidate", [budget[name] for budget in budgets])
+                for name in budgets[0]
+            }
+        )
+        prediction = self.model.predict(candidates)
+        return [
+            float(
+                -self._loss_fn(
+                    prediction.isel(candidate=i), **self._config["loss_fn_kwargs"]
+                )
+            )
+            for i in range(len(budgets))
+        ]
+
+    def _score(
+        self,
+        trials: list[optuna.Trial],
+        budgets: list[dict[str, float]],
+        callbacks: list[Callable] | None,
+        probes: list[dict[str, float]] | None = None,
+    ) -> list[float]:
+        """
+        Score the budgets of asked trials, and any probe budgets, with one model
+        prediction and tell the trials their values
+        """
+        try:
+            values = self._batch_losses(budgets + (probes or []))
+        except Exception:
+            for trial in trials:
+                frozen_trial = self.study.tell(
+                    trial, state=optuna.trial.TrialState.FAIL
+                )
+                for callback in callbacks or []:
+                    callback(self.study, frozen_trial)
+            raise
+
+        for trial, value in zip(trials, values):
+            frozen_trial = self.study.tell(trial, value)
+            for callback in callbacks or []:
+                callback(self.study, frozen_trial)
+        return values
+
+    def _stop_requested(self) -> bool:
+        return stop_requested(self.study)
+
+    def _finish(self) -> None:
+        # A study paused or cancelled before its first trial has no best trial
+        if not self.study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+        ):
+            return
+        self.sol = self.study.best_trial
+        self.optimal_budget = self.sol.user_attrs["budget"]
+        self.optimal_prediction = self.model.predict(self.optimal_budget)
+        feasible = [
+            trial.user_attrs["feasible"]
+            for trial in self.study.get_trials(deepcopy=False)
+            if "feasible" in trial.user_attrs
+        ]
+        if feasible:
+            self.study.set_user_attr(
+                "infeasible_fraction", 1 - sum(feasible) / len(feasible)
+            )
+
+    def optimize(
+        self,
+        bounds: dict[str, tuple[float, float]],
+        constraints: None | tuple = None,
+        timeout: int = 60,
+        n_trials: int = 100,
+        study_name: str = "optimizer",
+        load_if_exists: bool = False,
+        n_jobs: int = 1,
+        callbacks: list[Callable] | None = None,
+        warm_starts: list[dict[str, float]] | None = None,
+        sampling: Literal["sequential", "simplex"] = "sequential",
+    ):
+        """
+        Optimize the model, calling each callback with the study and every
+        finished trial. Budgets in `warm_starts` are evaluated first.
+        """
+        self._create_study(
+            bounds, constraints, study_name, load_if_exists, warm_starts, sampling
+        )
+        self.study.optimize(
+            self._opt_fn,
+            n_trials=n_trials,
+            timeout=timeout,
+            n_jobs=n_jobs,
+            callbacks=callbacks,
+        )
+        self._finish()
 
-    ...
+    def optimize_batched(
+        self,
+        bounds: dict[str, tuple[float, float]],
+        constraints: None | tuple = None,
+        timeout: int = 60,
+        n_trials: int = 100,
+        study_name: str = "optimizer",
+        load_if_exists: bool = False,
+        batch_size: int = 8,
+        callbacks: list[Callable] | None = None,
+        warm_starts: list[dict[str, float]] | None = None,
+        sampling: Literal["sequential", "simplex"] = "sequential",
+    ):
+        """
+        Optimize the model asking the sampler for `batch_size` trials at a time
+        and scoring them together with one model prediction
+        """
+        self._create_study(
+            bounds, constraints, study_name, load_if_exists, warm_starts, sampling
+        )
 
+        start = time.monotonic()
+        n_done = 0
+        while (
+            n_done < n_trials
+            and time.monotonic() - start < timeout
+            and not self._stop_requested()
+        ):
+            trials = [
+                self.study.ask() for _ in range(min(batch_size, n_trials - n_done))
+            ]
+            budgets = []
+            for trial in trials:
+                self._record_pending(trial)
+                budget = self.search_space(trial)
+                self._record_budget(trial, budget)
+                budgets.append(budget)
 
-MODEL_PATH = Path(__file__).parent / "example_files/slow_model"
+            self._score(trials, budgets, callbacks)
+            n_done += len(trials)
 
-revenue_model = BudgetModel("Revenue Model", "Revenue", MODEL_PATH)
+        self._finish()
 
+    def _ask_budget(
+        self, bounds: dict[str, tuple[float, float]], budget: dict | None = None
+    ) -> tuple[optuna.Trial, dict[str, float]]:
+        """Ask for a trial at `budget`, or at the next queued budget if None"""
+        if budget is not None:
+            self.study.enqueue_trial(budget)
+        trial = self.study.ask()
+        self._record_pending(trial)
+        budget = {
+            name: trial.suggest_float(name, *bound) for name, bound in bounds.items()
+        }
+        self._record_budget(trial, budget)
+        return trial, budget
 
-def create_optimizer(url: str, config_path: str) -> OptunaBudgetOptimizer:
+    def optimize_gradient(
+        self,
+        bounds: dict[str, tuple[float, float]],
+        constraints: None | tuple = None,
+        timeout: int = 60,
+        n_trials: int = 100,
+        study_name: str = "optimizer",
+        load_if_exists: bool = False,
+        method: Literal["SLSQP", "trust-constr"] = "SLSQP",
+        callbacks: list[Callable] | None = None,
+        warm_starts: list[dict[str, float]] | None = None,
+    ):
+        """
+        Optimize a smooth model with SciPy's SLSQP or trust-constr, which handle
+        the channel bounds and the total budget constraint directly.
+
+        The solver starts from the best of the queued budgets and the middle of
+        the bounds. Gradients are forward differences, scored together with the
+        point in one model prediction. Every point the solver visits is
+        recorded as a trial, and it stops after `n_trials` trials or `timeout`
+        seconds.
+        """
+        self._create_study(
+            bounds, constraints, study_name, load_if_exists, warm_starts
+        )
+        if constraints is None:
+            constraints = (-np.inf, np.inf)
+        names = list(bounds)
+        low = np.array([bounds[name][0] for name in names])
+        high = np.array([bounds[name][1] for name in names])
+
+        start = time.monotonic()
+        waiting = self.study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.WAITING,)
+        )
+        center = project_budget(
+            {name: (bounds[name][0] + bounds[name][1]) / 2 for name in names},
+            bounds,
+            constraints,
+        )
+        asked = [self._ask_budget(bounds) for _ in waiting]
+        if center is not None:
+            asked.append(self._ask_budget(bounds, center))
+        trials = [trial for trial, _ in asked]
+        budgets = [budget for _, budget in asked]
+        starts = list(zip(self._score(trials, budgets, callbacks), budgets))
+        completed = self.study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+        )
+        if completed:
+            best = max(completed, key=lambda trial: trial.values[0])
+            starts.append((best.values[0], best.user_attrs["budget"]))
+        x0 = max(starts, key=lambda start: start[0])[1]
+        x0 = np.array([x0[name] for name in names])
+        n_done = len(trials)
+
+        def fun(x: np.ndarray) -> tuple[float, np.ndarray]:
+            nonlocal n_done
+            if (
+                n_done >= n_trials
+                or time.monotonic() - start >= timeout
+                or self._stop_requested()
+            ):
+                raise _SolverStopped
+            # Solver iterates can be off the total budget by round-off
+            budget = project_budget(dict(zip(names, x)), bounds, constraints)
+            trial, budget = self._ask_budget(
+                bounds, budget or dict(zip(names, np.clip(x, low, high)))
+            )
+            point = np.array([budget[name] for name in names])
+            steps = FINITE_DIFFERENCE_STEP * np.maximum(np.abs(point), 1.0)
+            steps = np.where(point + steps > high, -steps, steps)
+            probes = [
+                dict(zip(names, point + step * unit))
+                for step, unit in zip(steps, np.eye(len(names)))
+            ]
+            values = self._score([trial], [budget], callbacks, probes)
+            n_done += 1
+            # SciPy minimizes while trial values are maximized
+            return -values[0], -(np.array(values[1:]) - values[0]) / steps
+
+        options = {"hess": optimize.BFGS()} if method == "trust-constr" else {}
+        try:
+            optimize.minimize(
+                fun,
+                x0,
+                jac=True,
+                method=method,
+                bounds=optimize.Bounds(low, high),
+                constraints=[
+                    optimize.LinearConstraint(np.ones((1, len(names))), *constraints)
+                ]
+                if np.isfinite(constraints).any()
+                else [],
+                options={"maxiter": n_trials},
+                **options,
+            )
+        except _SolverStopped:
+            pass
+        self._finish()
+
+    def _surrogate_candidates(
+        self,
+        rng: np.random.Generator,
+        bounds: dict[str, tuple[float, float]],
+        constraints: tuple,
+        n_candidates: int,
+        best: dict[str, float] | None,
+    ) -> list[dict[str, float]]:
+        """Random feasible budgets, half of them near the best budget if any"""
+        n_local = n_candidates // 2 if best is not None else 0
+        candidates = random_budgets(rng, n_candidates - n_local, bounds, constraints)
+        for _ in range(n_local):
+            budget = project_budget(
+                {
+                    name: best[name] + rng.normal(0, 0.1 * (high - low))
+                    for name, (low, high) in bounds.items()
+                },
+                bounds,
+                constraints,
+            )
+            if budget is not None:
+                candidates.append(budget)
+        return candidates
+
+    def _surrogate_training(
+        self, completed: list[optuna.trial.FrozenTrial], max_train: int
+    ) -> list[optuna.trial.FrozenTrial]:
+        """The best and the most recent completed trials, `max_train` at most"""
+        if len(completed) <= max_train:
+            return completed
+        best = sorted(completed, key=lambda trial: trial.values[0], reverse=True)
+        best = best[: max_train // 2]
+        numbers = {trial.number for trial in best}
+        recent = [
+            trial
+            for trial in sorted(completed, key=lambda trial: trial.number, reverse=True)
+            if trial.number not in numbers
+        ]
+        return best + recent[: max_train - len(best)]
+
+    def optimize_surrogate(
+        self,
+        bounds: dict[str, tuple[float, float]],
+        constraints: None | tuple = None,
+        timeout: int = 60,
+        n_trials: int = 100,
+        study_name: str = "optimizer",
+        load_if_exists: bool = False,
+        batch_size: int = 1,
+        callbacks: list[Callable] | None = None,
+        warm_starts: list[dict[str, float]] | None = None,
+        n_initial: int = 10,
+        n_candidates: int = 2048,
+        max_train: int = 200,
+        refit_every: int = 5,
+    ):
+        """
+        Optimize an expensive model by fitting a Gaussian process surrogate to
+        the completed trials and only scoring, `batch_size` at a time, the
+        candidate budgets with the highest expected improvement under it.
+
+        Queued budgets are scored first, then random budgets until `n_initial`
+        trials have completed. After that every round screens `n_candidates`
+        feasible budgets, half random and half near the best budget so far.
+
+        The surrogate is fitted to at most `max_train` trials, the best and the
+        most recent ones, and its hyperparameters are only optimized every
+        `refit_every` rounds, so each round costs about the same however many
+        trials the study has.
+        """
+        self._create_study(
+            bounds, constraints, study_name, load_if_exists, warm_starts
+        )
+        if constraints is None:
+            constraints = (-np.inf, np.inf)
+        names = list(bounds)
+        low = np.array([bounds[name][0] for name in names])
+        room = np.array([bounds[name][1] for name in names]) - low
+        room[room == 0] = 1.0
+
+        def scaled(budgets: list[dict[str, float]]) -> np.ndarray:
+            values = np.array([[budget[name] for name in names] for budget in budgets])
+            return (values - low) / room
+
+        rng = np.random.default_rng()
+        surrogate = GaussianProcess(seed=rng.integers(2**32))
+
+        start = time.monotonic()
+        n_done = 0
+        n_fits = 0
+        while (
+            n_done < n_trials
+            and time.monotonic() - start < timeout
+            and not self._stop_requested()
+        ):
+            n_batch = min(batch_size, n_trials - n_done)
+            waiting = self.study.get_trials(
+                deepcopy=False, states=(optuna.trial.TrialState.WAITING,)
+            )
+            completed = [
+                trial
+                for trial in self.study.get_trials(
+                    deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+                )
+                if "budget" in trial.user_attrs
+            ]
+            if waiting:
+                asked = [self._ask_budget(bounds) for _ in waiting[:n_batch]]
+            elif len(completed) < n_initial:
+                asked = [
+                    self._ask_budget(bounds, budget)
+                    for budget in random_budgets(rng, n_batch, bounds, constraints)
+                ]
+            else:
+                best = max(completed, key=lambda trial: trial.values[0])
+                candidates = self._surrogate_candidates(
+                    rng, bounds, constraints, n_candidates, best.user_attrs["budget"]
+                )
+                training = self._surrogate_training(completed, max_train)
+                surrogate.fit(
+                    scaled([trial.user_attrs["budget"] for trial in training]),
+                    np.array([trial.values[0] for trial in training]),
+                    optimize=n_fits % refit_every == 0,
+                )
+                n_fits += 1
+                mean, std = surrogate.predict(scaled(candidates))
+                improvement = expected_improvement(mean, std, best.values[0])
+                asked = []
+                for i in np.argsort(improvement)[::-1][:n_batch]:
+                    trial, budget = self._ask_budget(bounds, candidates[i])
+                    trial.set_user_attr(
+                        "expected_improvement", float(improvement[i])
+                    )
+                    asked.append((trial, budget))
+
+            trials = [trial for trial, _ in asked]
+            self._score(trials, [budget for _, budget in asked], callbacks)
+            n_done += len(trials)
+
+        self._finish()
+
+
+def create_optimizer(
+    storage: str | optuna.storages.BaseStorage,
+    config_path: str,
+    model: BudgetModel,
+    n_concurrent_trials: int = 1,
+) -> OptunaBudgetOptimizer:
     """Return an optimizer object"""
-    optimizer = OptunaBudgetOptimizer(
-        revenue_model,
+    optimizer = BudgetOptimizer(
+        model,
         config_path=config_path,
-        objective_name=revenue_model.model_kpi,
-        storage=url,
-        sampler_kwargs={},
+        objective_name=model.model_kpi,
+        storage=storage,
+        # Parallel workers and batches leave trials running while new ones are
+        # suggested, so let TPE treat them as bad results instead of
+        # suggesting the same point twice
+        sampler_kwargs={"constant_liar": n_concurrent_trials > 1},
     )
     return optimizer
 
@@ -37,4 +723,7 @@ if __name__ == "__main__":
     parser.add_argument("--PaidSearch", type=float, default=0)
     args = parser.parse_args()
     budget = {"a": args.OLV, "b": args.PaidSearch}
-    print(f"Total Revenue: ${revenue_model.predict(budget=budget).sum(...).item():.2f}")
+    model = BudgetModel(
+        "Revenue Model", "Revenue", Path(__file__).parent / "example_files/fast_model"
+    )
+    print(f"Total Revenue: ${model.predict(budget=budget).sum(...).item():.2f}")
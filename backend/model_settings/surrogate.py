@@ -0,0 +1,99 @@
+import numpy as np
+from scipy import linalg, stats
+from scipy.optimize import minimize
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel, one length
+    scale per input and a noise term, fitted by maximizing the marginal
+    likelihood. Inputs are expected to be scaled to the unit cube.
+    """
+
+    def __init__(self, n_restarts: int = 2, seed: int | None = None):
+        self.n_restarts = n_restarts
+        self.rng = np.random.default_rng(seed)
+
+    def _kernel(self, a: np.ndarray, b: np.ndarray, theta: np.ndarray) -> np.ndarray:
+        scale = np.exp(theta[: a.shape[1]])
+        distances = ((a[:, None, :] - b[None, :, :]) / scale) ** 2
+        return np.exp(theta[-2]) * np.exp(-0.5 * distances.sum(axis=-1))
+
+    def _factor(self, theta: np.ndarray) -> np.ndarray:
+        covariance = self._kernel(self.X, self.X, theta)
+        covariance[np.diag_indices_from(covariance)] += np.exp(theta[-1]) + 1e-8
+        return linalg.cholesky(covariance, lower=True)
+
+    def _negative_log_likelihood(self, theta: np.ndarray) -> float:
+        try:
+            factor = self._factor(theta)
+        except linalg.LinAlgError:
+            return np.inf
+        alpha = linalg.cho_solve((factor, True), self.y)
+        return 0.5 * self.y @ alpha + np.log(np.diag(factor)).sum()
+
+    def fit(
+        self, X: np.ndarray, y: np.ndarray, optimize: bool = True
+    ) -> "GaussianProcess":
+        """
+        Fit to `X` and `y`. Refits start from the previous hyperparameters
+        without restarts, or keep them as they are if `optimize` is False.
+        """
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = y.mean()
+        self.y_std = y.std() or 1.0
+        self.y = (y - self.y_mean) / self.y_std
+
+        n_inputs = self.X.shape[1]
+        # Log length scales, log signal variance and log noise variance
+        bounds = [(np.log(1e-2), np.log(10.0))] * n_inputs + [
+            (np.log(1e-2), np.log(1e2)),
+            (np.log(1e-8), np.log(1.0)),
+        ]
+        previous = getattr(self, "theta", None)
+        if previous is not None and len(previous) != n_inputs + 2:
+            previous = None
+        if previous is None:
+            starts = [np.r_[np.zeros(n_inputs), 0.0, np.log(1e-4)]] + [
+                np.array([self.rng.uniform(low, high) for low, high in bounds])
+                for _ in range(self.n_restarts)
+            ]
+        elif optimize:
+            starts = [previous]
+        else:
+            starts = []
+        if starts:
+            fits = [
+                minimize(
+                    self._negative_log_likelihood,
+                    start,
+                    method="L-BFGS-B",
+                    bounds=bounds,
+                )
+                for start in starts
+            ]
+            self.theta = min(fits, key=lambda fit: fit.fun).x
+        self.factor = self._factor(self.theta)
+        self.alpha = linalg.cho_solve((self.factor, True), self.y)
+        return self
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Posterior mean and standard deviation at `X`"""
+        cross = self._kernel(np.asarray(X, dtype=float), self.X, self.theta)
+        mean = cross @ self.alpha
+        v = linalg.solve_triangular(self.factor, cross.T, lower=True)
+        variance = np.maximum(np.exp(self.theta[-2]) - (v**2).sum(axis=0), 1e-12)
+        return (
+            mean * self.y_std + self.y_mean,
+            np.sqrt(variance) * self.y_std,
+        )
+
+
+def expected_improvement(
+    mean: np.ndarray, std: np.ndarray, best: float, xi: float = 0.0
+) -> np.ndarray:
+    """Expected amount by which a maximized value beats `best` plus `xi`"""
+    improvement = mean - best - xi
+    z = improvement / std
+    return improvement * stats.norm.cdf(z) + std * stats.norm.pdf(z)
@@ -0,0 +1,620 @@
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import optuna
+from sqlmodel import Session, create_engine
+
+from model_settings.early_stopping import (
+    EarlyStopping,
+    stop_on_request,
+    stop_requested,
+)
+from model_settings.model_registry import model_registry
+from model_settings.optimizer import create_optimizer, BudgetModel, BudgetOptimizer
+from utils.allocation import project_budget
+from utils.budget_classes import BudgetScenario, FrontierScenario, ACCEPTED_CHANNELS
+from utils.scheduler import Job, JobScheduler
+from utils.storage import create_storage, engine_kwargs
+from utils.tables import record_best_trial, record_frontier_point
+
+
+SECONDS_IN_MINUTE = 60
+CONFIG_PATH = Path(__file__).parent / "example_files"
+EVENT_LOG_SIZE = 10_000
+TERMINAL_EVENTS = ("done", "error", "deleted", "paused", "cancelled")
+# Status of a scenario whose running jobs have yet to reach a trial boundary
+STOPPING = {"paused": "pausing", "cancelled": "cancelling"}
+GRADIENT_METHODS = {"slsqp": "SLSQP", "trust-constr": "trust-constr"}
+
+
+def split_trials(n_trials: int, n_workers: int) -> list[int]:
+    """Split the trial budget of a scenario as evenly as possible across workers"""
+    return [
+        n_trials // n_workers + (i < n_trials % n_workers) for i in range(n_workers)
+    ]
+
+
+def scenario_bounds(budget_scenario: BudgetScenario) -> dict[str, tuple[float, float]]:
+    return {
+        channel: (
+            getattr(budget_scenario, channel.lower().replace(" ", "_")).lower_bound,
+            getattr(budget_scenario, channel.lower().replace(" ", "_")).upper_bound,
+        )
+        for channel in ACCEPTED_CHANNELS
+    }
+
+
+def frontier_totals(budget_scenario: FrontierScenario) -> list[float]:
+    """Total budgets of a frontier, evenly spaced over the total budget bounds"""
+    return np.linspace(
+        budget_scenario.total_budget.lower_bound,
+        budget_scenario.total_budget.upper_bound,
+        budget_scenario.n_points,
+    ).tolist()
+
+
+def _run_optimizer(
+    optimizer: BudgetOptimizer, budget_scenario: BudgetScenario, **kwargs
+) -> None:
+    if budget_scenario.solver == "surrogate":
+        optimizer.optimize_surrogate(batch_size=budget_scenario.batch_size, **kwargs)
+    elif budget_scenario.solver != "tpe":
+        optimizer.optimize_gradient(
+            method=GRADIENT_METHODS[budget_scenario.solver], **kwargs
+        )
+    elif budget_scenario.batch_size > 1:
+        optimizer.optimize_batched(
+            batch_size=budget_scenario.batch_size,
+            sampling=budget_scenario.sampling,
+            **kwargs,
+        )
+    else:
+        optimizer.optimize(n_jobs=1, sampling=budget_scenario.sampling, **kwargs)
+
+
+def optimize_scenario(
+    optimizer: BudgetOptimizer,
+    budget_scenario: BudgetScenario,
+    timeout: int,
+    n_trials: int,
+    load_if_exists: bool = False,
+    callbacks: list[Callable] | None = None,
+) -> None:
+    bounds = scenario_bounds(budget_scenario)
+    constraints = (
+        budget_scenario.total_budget.lower_bound,
+        budget_scenario.total_budget.upper_bound,
+    )
+    print(bounds, constraints)
+    _run_optimizer(
+        optimizer,
+        budget_scenario,
+        bounds=bounds,
+        constraints=constraints,
+        study_name=budget_scenario.name,
+        n_trials=n_trials,
+        timeout=timeout * SECONDS_IN_MINUTE,
+        load_if_exists=load_if_exists,
+        callbacks=callbacks,
+    )
+
+
+def optimize_frontier(
+    optimizer: BudgetOptimizer,
+    budget_scenario: FrontierScenario,
+    timeout: int,
+    n_trials: int,
+    on_point: Callable[[int, float, optuna.trial.FrozenTrial], None],
+    should_stop: Callable[[], bool] | None = None,
+) -> None:
+    """
+    Solve a scenario at every total budget of its frontier, calling `on_point`
+    with the point, its total budget and its best trial after each solve.
+    The sweep ends early once `should_stop` returns True between two points.
+
+    The grid is swept up and then back down, each pass taking half of the
+    trials of a point. Every point starts from the best allocations of its
+    neighbours and the initial budget, moved onto its own total budget, so
+    few trials are spent rediscovering the shape of the allocation.
+    """
+    bounds = scenario_bounds(budget_scenario)
+    totals = frontier_totals(budget_scenario)
+    n_runs = 2 * len(totals)
+    point_trials = split_trials(n_trials, n_runs)
+    initial_budget = {
+        channel: getattr(
+            budget_scenario, channel.lower().replace(" ", "_")
+        ).initial_budget
+        for channel in ACCEPTED_CHANNELS
+    }
+
+    best: dict[int, dict[str, float]] = {}
+    points = list(range(len(totals)))
+    for sweep, order in enumerate((points, points[::-1])):
+        for point in order:
+            if should_stop is not None and should_stop():
+                return
+            constraints = (totals[point], totals[point])
+            warm_starts = [
+                budget
+                for start in [best.get(point - 1), best.get(point + 1), initial_budget]
+                if start is not None
+                and (budget := project_budget(start, bounds, constraints)) is not None
+            ]
+            _run_optimizer(
+                optimizer,
+                budget_scenario,
+                bounds=bounds,
+                constraints=constraints,
+                study_name=f"{budget_scenario.name}@{point}",
+                n_trials=max(point_trials[sweep * len(totals) + point], 1),
+                timeout=timeout * SECONDS_IN_MINUTE / n_runs,
+                load_if_exists=sweep > 0,
+                warm_starts=warm_starts,
+            )
+            best_trial = optimizer.study.best_trial
+            best[point] = best_trial.user_attrs["budget"]
+            on_point(point, totals[point], best_trial)
+
+
+class OptimizerWorker(mp.Process):
+    """
+    Long-lived optimizer process. The active model is loaded and the storage
+    connected when the worker starts, then scenarios are taken from the job
+    queue until `max_jobs` have run. Scenarios pinned to another model version
+    load it on their first job.
+    """
+
+    def __init__(self, url: str, jobs: mp.Queue, events: mp.Queue, max_jobs: int):
+        mp.Process.__init__(self)
+        self.daemon = True
+        self.url = url
+        self.jobs = jobs
+        self.events = events
+        self.max_jobs = max_jobs
+
+    def _send(
+        self, job_id: int, budget_scenario: BudgetScenario, status: str, **kwargs
+    ) -> None:
+        self.events.put(
+            {
+                "job": job_id,
+                "scenario": budget_scenario.name,
+                "worker": self.name,
+                "status": status,
+            }
+            | kwargs
+        )
+
+    def _trial_callback(self, job_id: int, budget_scenario: BudgetScenario):
+        """Report every finished trial back to the API process"""
+
+        def callback(study: optuna.Study, trial: optuna.trial.FrozenTrial) -> None:
+            self._send(
+                job_id,
+                budget_scenario,
+                "trial",
+                number=trial.number,
+                completed=trial.state == optuna.trial.TrialState.COMPLETE,
+                values=trial.values,
+                budget=trial.user_attrs.get("budget", {}),
+            )
+
+        return callback
+
+    def _best_trial_callback(self, engine, budget_scenario: BudgetScenario):
+        """Persist the best trial whenever this worker improves on it"""
+        best_value = -np.inf
+
+        def callback(study: optuna.Study, trial: optuna.trial.FrozenTrial) -> None:
+            nonlocal best_value
+            if trial.state != optuna.trial.TrialState.COMPLETE:
+                return
+            if trial.values[0] <= best_value:
+                return
+            best_value = trial.values[0]
+            with Session(engine) as session:
+                record_best_trial(
+                    session,
+                    budget_scenario.name,
+                    trial.number,
+                    best_value,
+                    trial.user_attrs.get("budget", {}),
+                )
+
+        return callback
+
+    def _frontier_callback(self, engine, job_id: int, budget_scenario: BudgetScenario):
+        """Persist and report the best allocation of every frontier point"""
+
+        def callback(
+            point: int, total_budget: float, trial: optuna.trial.FrozenTrial
+        ) -> None:
+            budget = trial.user_attrs.get("budget", {})
+            with Session(engine) as session:
+                record_frontier_point(
+                    session, budget_scenario.name, point, trial.values[0], budget
+                )
+            self._send(
+                job_id,
+                budget_scenario,
+                "point",
+                point=point,
+                total_budget=total_budget,
+                value=trial.values[0],
+                budget=budget,
+            )
+
+        return callback
+
+    def _optimize(
+        self,
+        storage: optuna.storages.BaseStorage,
+        engine,
+        optimizers: dict,
+        model: BudgetModel,
+        job_id: int,
+        budget_scenario: BudgetScenario,
+        n_trials: int,
+    ) -> None:
+        if isinstance(budget_scenario, FrontierScenario):
+            # Frontier points are solved one after another and only the best
+            # allocation of each is kept
+            optimize_frontier(
+                create_optimizer(
+                    optuna.storages.InMemoryStorage(),
+                    CONFIG_PATH,
+                    model,
+                    n_concurrent_trials=budget_scenario.batch_size,
+                ),
+                budget_scenario,
+                budget_scenario.timeout,
+                n_trials,
+                on_point=self._frontier_callback(engine, job_id, budget_scenario),
+                should_stop=lambda: stop_requested(
+                    optuna.load_study(study_name=budget_scenario.name, storage=storage)
+                ),
+            )
+            return
+
+        n_concurrent_trials = budget_scenario.n_workers * budget_scenario.batch_size
+        # Optimizers only differ by model and whether TPE expects concurrent trials.
+        # Those of other versions are dropped so they do not keep evicted models
+        # loaded
+        key = (model.model_version, n_concurrent_trials > 1)
+        for other in [other for other in optimizers if other[0] != key[0]]:
+            del optimizers[other]
+        if key not in optimizers:
+            optimizers[key] = create_optimizer(
+                storage, CONFIG_PATH, model, n_concurrent_trials=n_concurrent_trials
+            )
+        # Both stop the study at the next trial once it is paused or
+        # cancelled, the early stopping rules also on their own
+        early_stopping = EarlyStopping.from_scenario(budget_scenario)
+        optimize_scenario(
+            optimizers[key],
+            budget_scenario,
+            budget_scenario.timeout,
+            n_trials,
+            load_if_exists=True,
+            callbacks=[
+                self._trial_callback(job_id, budget_scenario),
+                self._best_trial_callback(engine, budget_scenario),
+                early_stopping if early_stopping is not None else stop_on_request,
+            ],
+        )
+
+    def run(self):
+        storage = create_storage(self.url)
+        engine = create_engine(self.url, **engine_kwargs())
+        # Start warm, so the first scenario does not wait for the model to load
+        try:
+            model_registry.preload()
+        except Exception as e:
+            print(f"Error preloading the active model: {e}")
+        optimizers = {}
+        for _ in range(self.max_jobs):
+            job = self.jobs.get()
+            if job is None:
+                break
+            job_id, budget_scenario, n_trials = job
+            try:
+                print("Running...")
+                self._send(job_id, budget_scenario, "running")
+                # The model is pinned while the job runs
+                with model_registry.use(budget_scenario.model_version) as model:
+                    self._optimize(
+                        storage,
+                        engine,
+                        optimizers,
+                        model,
+                        job_id,
+                        budget_scenario,
+                        n_trials,
+                    )
+                print("Done")
+                self._send(job_id, budget_scenario, "done")
+            except Exception as e:
+                self._send(
+                    job_id,
+                    budget_scenario,
+                    "error",
+                    error=str(e),
+                    traceback=traceback.format_exc(),
+                )
+
+
+class OptimizerPool:
+    """
+    Pool of pre-warmed optimizer workers fed from a shared job queue.
+    Workers exit after `max_jobs_per_worker` scenarios and are replaced.
+
+    Jobs wait in a `JobScheduler` and are only handed to the workers while
+    fewer than `max_concurrent` are running.
+
+    Trial results, new best values and the final state of each scenario are
+    kept in a bounded in-memory event log that clients can follow.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        size: int,
+        max_jobs_per_worker: int,
+        max_concurrent: int | None = None,
+        max_queued: int = 100,
+    ):
+        self.url = url
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.scheduler = JobScheduler(
+            min(max_concurrent or size, size), max_queued=max_queued
+        )
+        self.jobs = mp.Queue()
+        self.events = mp.Queue()
+        self.workers: list[OptimizerWorker] = []
+        self.status: dict[str, str] = {}
+        self._outstanding: dict[str, int] = {}
+        self._stopping: dict[str, str] = {}
+        self._current: dict[str, int] = {}
+        self._best: dict[str, float] = {}
+        self._event_log: dict[str, deque] = {}
+        self._event_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, daemon=True)
+
+    def _spawn(self) -> OptimizerWorker:
+        worker = OptimizerWorker(
+            self.url, self.jobs, self.events, self.max_jobs_per_worker
+        )
+        worker.start()
+        return worker
+
+    def start(self) -> None:
+        self.workers = [self._spawn() for _ in range(self.size)]
+        self._monitor.start()
+
+    def _jobs(self, budget_scenario: BudgetScenario) -> list[Job]:
+        # A frontier sweep warm-starts each point from the last, a gradient
+        # solver follows a single path and the surrogate picks each batch from
+        # all trials so far, so these run on a single worker
+        n_workers = (
+            1
+            if isinstance(budget_scenario, FrontierScenario)
+            or budget_scenario.solver != "tpe"
+            else budget_scenario.n_workers
+        )
+        return [
+            Job(
+                name=budget_scenario.name,
+                user=budget_scenario.user,
+                priority=budget_scenario.priority,
+                n_trials=n_trials,
+                timeout=budget_scenario.timeout * SECONDS_IN_MINUTE,
+                payload=budget_scenario,
+            )
+            for n_trials in split_trials(budget_scenario.n_trials, n_workers)
+            if n_trials > 0
+        ]
+
+    def submit(self, budget_scenario: BudgetScenario) -> None:
+        """
+        Queue a scenario, split into one job per requested worker.
+        Raises `QueueFullError` if the queue cannot take all of its jobs.
+        """
+        self.submit_many([budget_scenario])
+
+    def submit_many(self, budget_scenarios: list[BudgetScenario]) -> None:
+        """Queue several scenarios at once, either all of them or none"""
+        jobs = {
+            budget_scenario.name: self._jobs(budget_scenario)
+            for budget_scenario in budget_scenarios
+        }
+        with self._lock:
+            self.scheduler.submit([job for group in jobs.values() for job in group])
+            for name, group in jobs.items():
+                self._outstanding[name] = len(group)
+                self._stopping.pop(name, None)
+                self.status[name] = "queued"
+                self._event_log[name] = deque(maxlen=EVENT_LOG_SIZE)
+                self._best.pop(name, None)
+            self._dispatch()
+
+    def remove(self, name: str) -> None:
+        """
+        Drop the jobs of a scenario that have not started yet and forget it
+        once its running jobs, which fail without their study, have ended
+        """
+        with self._lock:
+            if name in self._outstanding:
+                self._outstanding[name] -= self.scheduler.remove(name)
+            self._stopping[name] = "deleted"
+            if self._outstanding.get(name, 0) == 0:
+                self._settle(name)
+
+    def stop(self, name: str, status: str) -> str:
+        """
+        Drop the queued jobs of a scenario and mark it `status`, "paused" or
+        "cancelled", once its running jobs stop at their next trial, or at once
+        if none are running. Returns the status of the scenario.
+        """
+        with self._lock:
+            if self._outstanding.get(name, 0) > 0:
+                self._outstanding[name] -= self.scheduler.remove(name)
+            self._stopping[name] = status
+            if self._outstanding.get(name, 0) == 0:
+                self._settle(name)
+            else:
+                self.status[name] = STOPPING[status]
+            self._dispatch()
+            return self.status[name]
+
+    def active(self) -> list[str]:
+        """Names of the scenarios that are queued or running"""
+        with self._lock:
+            return [name for name, n in self._outstanding.items() if n > 0]
+
+    def _dispatch(self) -> None:
+        while (job := self.scheduler.pop()) is not None:
+            self.jobs.put((job.id, job.payload, job.n_trials))
+
+    def _describe(self, job: Job, start: float, position: int) -> dict:
+        return {
+            "scenario": job.name,
+            "user": job.user,
+            "priority": job.priority,
+            "n_trials": job.n_trials,
+            "position": position,
+            "estimated_start": datetime.fromtimestamp(start).isoformat(),
+        }
+
+    def queue_info(self) -> dict:
+        """Running jobs and queued jobs in the order they will start"""
+        with self._lock:
+            return {
+                "max_concurrent": self.scheduler.max_concurrent,
+                "running": [
+                    self._describe(job, job.started_at, 0)
+                    for job in self.scheduler.running.values()
+                ],
+                "queued": [
+                    self._describe(job, start, position)
+                    for position, (job, start) in enumerate(
+                        self.scheduler.ordered(), start=1
+                    )
+                ],
+            }
+
+    def is_active(self, name: str) -> bool:
+        with self._lock:
+            return self._outstanding.get(name, 0) > 0
+
+    def _publish(self, name: str, event: str, data: dict) -> None:
+        self._event_log.setdefault(name, deque(maxlen=EVENT_LOG_SIZE)).append(
+            {"id": next(self._event_ids), "event": event, "data": data}
+        )
+
+    def events_since(self, name: str, last_id: int) -> list[dict] | None:
+        """Events of a scenario newer than `last_id`, or None for an unknown scenario"""
+        with self._lock:
+            if name not in self._event_log:
+                return None
+            return [event for event in self._event_log[name] if event["id"] > last_id]
+
+    def _record_trial(self, name: str, event: dict) -> None:
+        trial = {
+            key: event[key] for key in ("number", "completed", "values", "budget")
+        }
+        self._publish(name, "trial", trial)
+        if trial["completed"] and trial["values"][0] > self._best.get(name, -np.inf):
+            self._best[name] = trial["values"][0]
+            self._publish(name, "best", trial)
+
+    def _settle(self, name: str) -> None:
+        status = self._stopping.pop(name, "done")
+        if status == "deleted":
+            self.status.pop(name, None)
+            self._outstanding.pop(name, None)
+            self._publish(name, status, {})
+            return
+        self.status[name] = status
+        self._publish(name, status, {"best_value": self._best.get(name)})
+
+    def _finish(self, name: str, status: str, error: str | None = None) -> None:
+        self._outstanding[name] = max(self._outstanding.get(name, 0) - 1, 0)
+        if self.status.get(name) == "error":
+            return
+        if status == "error" and self._stopping.get(name) != "deleted":
+            self._stopping.pop(name, None)
+            self.status[name] = "error"
+            self._publish(name, "error", {"error": error})
+        elif self._outstanding[name] == 0:
+            self._settle(name)
+
+    def _handle(self, event: dict) -> None:
+        name = event["scenario"]
+        with self._lock:
+            if event["status"] == "trial":
+                self._record_trial(name, event)
+                return
+            if event["status"] == "point":
+                self._publish(
+                    name,
+                    "point",
+                    {
+                        key: event[key]
+                        for key in ("point", "total_budget", "value", "budget")
+                    },
+                )
+                return
+            if event["status"] == "running":
+                self._current[event["worker"]] = event["job"]
+                if self.status.get(name) == "queued":
+                    self.status[name] = "running"
+                return
+            self._current.pop(event["worker"], None)
+            if event["status"] == "error":
+                print(f"Error optimizing {name}: {event['error']}")
+                print(event["traceback"])
+            self.scheduler.finish(event["job"], completed=event["status"] == "done")
+            self._finish(name, event["status"], event.get("error"))
+            self._dispatch()
+
+    def _recycle(self) -> None:
+        for i, worker in enumerate(self.workers):
+            if worker.is_alive() or self._stopped.is_set():
+                continue
+            worker.join()
+            with self._lock:
+                # A worker that crashed mid-scenario never reported back
+                job_id = self._current.pop(worker.name, None)
+                if worker.exitcode != 0 and job_id is not None:
+                    job = self.scheduler.finish(job_id, completed=False)
+                    if job is not None:
+                        self._finish(job.name, "error", "Optimizer worker crashed")
+                    self._dispatch()
+            self.workers[i] = self._spawn()
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._handle(self.events.get(timeout=1))
+            except queue.Empty:
+                pass
+            self._recycle()
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+        self.workers = []
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+from budget_optimizer.utils.model_helpers import load_module
+
+from model_settings.optimizer import PARITY_RTOL
+
+
+MODEL_DIR = Path(__file__).parent.parent / "model_settings" / "example_files"
+# The slow model sleeps on every prediction, so it gets fewer budgets
+N_BUDGETS = {"fast_model": 50, "slow_model": 2}
+
+
+def load_config(model_name: str):
+    module = load_module("model_config", MODEL_DIR / model_name / "model_config.py")
+    return module, module.model_loader(MODEL_DIR / model_name)
+
+
+def random_budgets(model, n: int, seed: int = 0) -> list[dict[str, float]]:
+    rng = np.random.default_rng(seed)
+    channels = list(model.data.data_vars)
+    return [dict(zip(channels, rng.uniform(0, 20, len(channels)))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("model_name", N_BUDGETS)
+def test_predict_into_matches_predict(model_name):
+    module, model = load_config(model_name)
+    buffers = {}
+    for budget in random_budgets(model, N_BUDGETS[model_name]):
+        expected = model.predict(module.budget_to_data(budget, model))
+        actual = module.predict_into(budget, model, buffers)
+        xr.testing.assert_allclose(expected, actual, rtol=PARITY_RTOL)
+
+
+@pytest.mark.parametrize("model_name", N_BUDGETS)
+def test_numpy_kernel_matches_predict(model_name):
+    module, model = load_config(model_name)
+    module.predict_kernel = module._predict_ufuncs
+    buffers = {}
+    for budget in random_budgets(model, N_BUDGETS[model_name], seed=1):
+        expected = model.predict(module.budget_to_data(budget, model))
+        actual = module.predict_into(budget, model, buffers)
+        xr.testing.assert_allclose(expected, actual, rtol=PARITY_RTOL)
+
+
+@pytest.mark.parametrize("model_name", N_BUDGETS)
+def test_unknown_channels_are_rejected(model_name):
+    module, model = load_config(model_name)
+    budget = {"Unknown": 1.0}
+    with pytest.raises(KeyError):
+        module.budget_to_data(budget, model)
+    with pytest.raises(KeyError):
+        module.predict_into(budget, model, {})
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def project_budget(
+    budget: dict[str, float],
+    bounds: dict[str, tuple[float, float]],
+    total: tuple[float, float],
+) -> dict[str, float] | None:
+    """
+    Move a budget into the channel bounds and the total budget range.
+    Channels are clipped to their bounds, then the shortfall or excess is
+    spread over the channels in proportion to the room each has left.
+    Returns None if the bounds cannot reach the total budget range.
+    """
+    clipped = {
+        channel: min(max(budget.get(channel, low), low), high)
+        for channel, (low, high) in bounds.items()
+    }
+    target = min(max(sum(clipped.values()), total[0]), total[1])
+    shortfall = target - sum(clipped.values())
+    if shortfall == 0:
+        return clipped
+
+    room = {
+        channel: (high - clipped[channel] if shortfall > 0 else clipped[channel] - low)
+        for channel, (low, high) in bounds.items()
+    }
+    total_room = sum(room.values())
+    if total_room < abs(shortfall):
+        return None
+    return {
+        channel: value + shortfall * room[channel] / total_room
+        for channel, value in clipped.items()
+    }
+
+
+def is_feasible(
+    budget: dict[str, float],
+    bounds: dict[str, tuple[float, float]],
+    total: tuple[float, float],
+    tol: float = 1e-6,
+) -> bool:
+    """Whether a budget is within the channel bounds and the total budget range"""
+    spend = sum(budget.values())
+    return total[0] - tol <= spend <= total[1] + tol and all(
+        low - tol <= budget.get(channel, 0) <= high + tol
+        for channel, (low, high) in bounds.items()
+    )
+
+
+def simplex_to_budget(
+    total: float,
+    weights: dict[str, float],
+    bounds: dict[str, tuple[float, float]],
+) -> dict[str, float]:
+    """
+    Spread `total` over the channels. Each channel gets its lower bound plus a
+    part of its room up to the upper bound, where the part is its weight times
+    a common scale, and channels whose part reaches one are filled up.
+    Every total between the sums of the bounds gives a feasible budget, and
+    every feasible budget comes from some weights in [0, 1].
+    """
+    room = {channel: high - low for channel, (low, high) in bounds.items()}
+    spare = total - sum(low for low, _ in bounds.values())
+    # A zero weight would leave a channel no share of a total it is needed for
+    weights = {channel: max(weights[channel], 1e-9) for channel in bounds}
+    # Raise the scale until the channel with the next largest weight fills up
+    order = sorted(bounds, key=lambda channel: weights[channel], reverse=True)
+    filled = 0
+    while True:
+        filled_room = sum(room[channel] for channel in order[:filled])
+        open_room = sum(room[channel] * weights[channel] for channel in order[filled:])
+        if filled == len(order) or open_room <= 0:
+            break
+        if (spare - filled_room) * weights[order[filled]] < open_room:
+            break
+        filled += 1
+
+    scale = (spare - filled_room) / open_room if open_room > 0 else 0.0
+    parts = {channel: 1.0 for channel in order[:filled]} | {
+        channel: min(scale * weights[channel], 1.0) for channel in order[filled:]
+    }
+    return {
+        channel: low + room[channel] * parts[channel]
+        for channel, (low, _) in bounds.items()
+    }
+
+
+def budget_to_simplex(
+    budget: dict[str, float], bounds: dict[str, tuple[float, float]]
+) -> tuple[float, dict[str, float]]:
+    """The total and weights that `simplex_to_budget` maps to a feasible budget"""
+    parts = {
+        channel: (budget[channel] - low) / (high - low) if high > low else 0.0
+        for channel, (low, high) in bounds.items()
+    }
+    scale = max(parts.values(), default=0.0)
+    return sum(budget.values()), {
+        channel: part / scale if scale > 0 else 0.0 for channel, part in parts.items()
+    }
+
+
+def random_budgets(
+    rng: np.random.Generator,
+    n: int,
+    bounds: dict[str, tuple[float, float]],
+    total: tuple[float, float],
+) -> list[dict[str, float]]:
+    """`n` random budgets within the channel bounds and the total budget range"""
+    total = (
+        max(total[0], sum(low for low, _ in bounds.values())),
+        min(total[1], sum(high for _, high in bounds.values())),
+    )
+    return [
+        simplex_to_budget(
+            rng.uniform(*total),
+            dict(zip(bounds, rng.uniform(size=len(bounds)))),
+            bounds,
+        )
+        for _ in range(n)
+    ]
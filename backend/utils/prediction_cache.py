@@ -0,0 +1,77 @@
+import threading
+from typing import Callable, Hashable
+
+from cachetools import LRUCache
+
+
+class _LRUCache(LRUCache):
+    """LRU cache that counts how many entries it has evicted"""
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of model predictions keyed by a canonical budget.
+
+    Budgets are sorted by channel and rounded to `decimals` places so that
+    equivalent budgets share one entry, and the model version is part of the
+    key so a retrained model never serves stale predictions.
+    """
+
+    def __init__(self, maxsize: int = 1024, decimals: int = 6):
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._cache = _LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def key(self, budget: dict[str, float], model_version: str) -> Hashable:
+        return (
+            model_version,
+            tuple(
+                sorted(
+                    (name, round(float(value), self.decimals))
+                    for name, value in budget.items()
+                )
+            ),
+        )
+
+    def get_or_compute(
+        self, budget: dict[str, float], model_version: str, compute: Callable
+    ):
+        """Return the cached prediction for a budget, computing it on a miss"""
+        key = self.key(budget, model_version)
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def info(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self._cache.evictions,
+                "size": self._cache.currsize,
+                "maxsize": self._cache.maxsize,
+            }
@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+
+class QueueFullError(Exception):
+    """Raised when admitting more jobs would exceed the queue limit"""
+
+
+@dataclass
+class Job:
+    name: str
+    user: str
+    priority: int
+    n_trials: int
+    timeout: float  # seconds
+    payload: Any = field(repr=False)
+    id: int = field(default_factory=itertools.count().__next__)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+
+
+class JobScheduler:
+    """
+    Bounded job queue with a global concurrency cap.
+
+    Jobs with a higher priority start first. Within a priority, the user with
+    the fewest running jobs goes next, and ties are broken first in, first out.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queued: list[Job] = []
+        self.running: dict[int, Job] = {}
+        self._seconds_per_trial: float | None = None
+
+    def submit(self, jobs: list[Job]) -> None:
+        if len(self.queued) + len(jobs) > self.max_queued:
+            raise QueueFullError(
+                f"The optimizer queue is full ({self.max_queued} jobs), try again later"
+            )
+        self.queued.extend(jobs)
+
+    def _pick(self, queued: list[Job], running_per_user: Counter) -> Job:
+        return min(
+            queued, key=lambda job: (-job.priority, running_per_user[job.user], job.id)
+        )
+
+    def _running_per_user(self) -> Counter:
+        return Counter(job.user for job in self.running.values())
+
+    def pop(self) -> Job | None:
+        """Take the next job if there is a free slot"""
+        if not self.queued or len(self.running) >= self.max_concurrent:
+            return None
+        job = self._pick(self.queued, self._running_per_user())
+        self.queued.remove(job)
+        job.started_at = time.time()
+        self.running[job.id] = job
+        return job
+
+    def finish(self, job_id: int, completed: bool = True) -> Job | None:
+        job = self.running.pop(job_id, None)
+        if job is None or not completed or job.n_trials < 1:
+            return job
+        seconds_per_trial = (time.time() - job.started_at) / job.n_trials
+        if self._seconds_per_trial is None:
+            self._seconds_per_trial = seconds_per_trial
+        else:
+            self._seconds_per_trial = (
+                0.8 * self._seconds_per_trial + 0.2 * seconds_per_trial
+            )
+        return job
+
+    def remove(self, name: str) -> int:
+        """Drop the queued jobs of a scenario and return how many were dropped"""
+        n_queued = len(self.queued)
+        self.queued = [job for job in self.queued if job.name != name]
+        return n_queued - len(self.queued)
+
+    def estimated_duration(self, job: Job) -> float:
+        if self._seconds_per_trial is None:
+            return job.timeout
+        return min(job.timeout, job.n_trials * self._seconds_per_trial)
+
+    def ordered(self) -> list[tuple[Job, float]]:
+        """Queued jobs in the order they will start, with estimated start times"""
+        now = time.time()
+        slots = [
+            max(job.started_at + self.estimated_duration(job), now)
+            for job in self.running.values()
+        ]
+        slots += [now] * (self.max_concurrent - len(slots))
+        heapq.heapify(slots)
+
+        queued = list(self.queued)
+        running_per_user = self._running_per_user()
+        order = []
+        while queued:
+            job = self._pick(queued, running_per_user)
+            queued.remove(job)
+            running_per_user[job.user] += 1
+            start = heapq.heappop(slots)
+            heapq.heappush(slots, start + self.estimated_duration(job))
+            order.append((job, start))
+        return order
@@ -0,0 +1,37 @@
+import shutil
+import tempfile
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import xarray as xr
+
+
+def share_dataset(dataset: xr.Dataset, directory: Path) -> xr.Dataset:
+    """
+    The dataset with its data variables replaced by read-only memory maps of
+    `.npy` files in `directory`, which are written by the first process to
+    share it. Every process mapping the same files reads one copy of the data
+    from the page cache instead of holding its own.
+    """
+    if not directory.exists():
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(
+            tempfile.mkdtemp(prefix=f"{directory.name}.", dir=directory.parent)
+        )
+        for name, variable in dataset.data_vars.items():
+            np.save(staging / f"{quote(str(name), safe='')}.npy", variable.values)
+        try:
+            # Renaming is atomic, so other processes never see partial files
+            staging.rename(directory)
+        except OSError:
+            # Another process shared the same data first
+            shutil.rmtree(staging)
+    return dataset.copy(
+        data={
+            name: np.load(
+                directory / f"{quote(str(name), safe='')}.npy", mmap_mode="r"
+            )
+            for name in dataset.data_vars
+        }
+    )
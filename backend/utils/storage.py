@@ -0,0 +1,78 @@
+import os
+import threading
+
+import optuna
+from cachetools import TTLCache
+from sqlalchemy.engine import make_url
+
+
+# Drivers of SQLAlchemy's asyncio engine for each database
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def engine_kwargs() -> dict:
+    """SQLAlchemy connection pool settings, configured from the environment"""
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+
+
+def async_url(url: str) -> str:
+    """The URL of the same database for SQLAlchemy's asyncio engine"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(
+        hide_password=False
+    )
+
+
+def create_storage(url: str) -> optuna.storages.RDBStorage:
+    """
+    Optuna storage to share across a process, with one pooled engine. Passing
+    the URL string instead builds a new engine on every call. Studies loaded
+    from it get their own trial cache from Optuna, while study names and ids
+    are cached by `StudyMetadataCache`.
+    """
+    return optuna.storages.RDBStorage(url, engine_kwargs=engine_kwargs())
+
+
+class StudyMetadataCache:
+    """
+    Read-through cache of study names and ids. Entries expire after `ttl`
+    seconds, so changes made by other processes show up within that time.
+    """
+
+    def __init__(self, storage: optuna.storages.BaseStorage, ttl: float = 5):
+        self.storage = storage
+        self._names = TTLCache(maxsize=1, ttl=ttl)
+        self._ids = TTLCache(maxsize=4096, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def study_names(self) -> list[str]:
+        with self._lock:
+            names = self._names.get("names")
+        if names is None:
+            names = [
+                study.study_name for study in self.storage.get_all_studies()
+            ]
+            with self._lock:
+                self._names["names"] = names
+        return names
+
+    def study_id(self, name: str) -> int:
+        """Id of a study, raising `KeyError` if it does not exist"""
+        with self._lock:
+            study_id = self._ids.get(name)
+        if study_id is None:
+            study_id = self.storage.get_study_id_from_name(name)
+            with self._lock:
+                self._ids[name] = study_id
+        return study_id
+
+    def invalidate(self, name: str) -> None:
+        """Forget a study that was just created or deleted"""
+        with self._lock:
+            self._names.clear()
+            self._ids.pop(name, None)
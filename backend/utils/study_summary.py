@@ -0,0 +1,73 @@
+import numpy as np
+import optuna
+
+from utils.budget_classes import ACCEPTED_CHANNELS
+
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+FINISHED_STATES = (
+    optuna.trial.TrialState.COMPLETE,
+    optuna.trial.TrialState.PRUNED,
+    optuna.trial.TrialState.FAIL,
+)
+
+
+def _describe(values: np.ndarray) -> dict | None:
+    if values.size == 0:
+        return None
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "quantiles": dict(
+            zip(map(str, QUANTILES), np.quantile(values, QUANTILES).tolist())
+        ),
+    }
+
+
+def summarize_trials(columns: dict[str, list[int | float | None]]) -> dict:
+    """
+    Summarize trial columns (see `trials_to_columns`): trial counts by state,
+    the best trial, the best value after each completed trial and the range
+    and quantiles of the objective and every channel over completed trials
+    """
+    number = np.asarray(columns["number"], dtype=np.int64)
+    state = np.asarray(columns["state"], dtype=np.int8)
+    objective = np.asarray(columns["objective"], dtype=np.float64)
+
+    completed = np.flatnonzero(state == optuna.trial.TrialState.COMPLETE.value)
+    completed = completed[np.argsort(number[completed], kind="stable")]
+    completed_objective = objective[completed]
+    channels = {
+        channel: np.asarray(columns[channel], dtype=np.float64)[completed]
+        for channel in ACCEPTED_CHANNELS
+    }
+
+    states, counts = np.unique(state, return_counts=True)
+    best_trial = None
+    if completed.size:
+        best = int(np.argmax(completed_objective))
+        best_trial = {
+            "number": int(number[completed[best]]),
+            "value": float(completed_objective[best]),
+            "budget": {
+                channel: float(values[best]) for channel, values in channels.items()
+            },
+        }
+
+    return {
+        "n_trials": int(number.size),
+        "states": {
+            optuna.trial.TrialState(int(value)).name: int(count)
+            for value, count in zip(states, counts)
+        },
+        "best_trial": best_trial,
+        "running_best": {
+            "number": number[completed].tolist(),
+            "value": completed_objective.tolist(),
+            "best": np.maximum.accumulate(completed_objective).tolist(),
+        },
+        "objective": _describe(completed_objective),
+        "channels": {
+            channel: _describe(values) for channel, values in channels.items()
+        },
+    }
@@ -0,0 +1,120 @@
+from typing import List, Optional
+
+from sqlalchemy import JSON, Column, delete, or_, update
+from sqlmodel import Field, Relationship, Session, SQLModel
+
+
+class BudgetScenarioSettings(SQLModel, table=True):
+    __tablename__ = "budgetscenariosettings"
+    name: str = Field(primary_key=True)
+    # total_budget: float = Field(default=Field(..., ge=0))
+    budget: List["BudgetSettings"] = Relationship(
+        back_populates="budget_scenario", cascade_delete=True
+    )
+    best_trial: Optional["BestTrial"] = Relationship(
+        back_populates="budget_scenario",
+        cascade_delete=True,
+        sa_relationship_kwargs={"uselist": False},
+    )
+    frontier: List["FrontierPoint"] = Relationship(
+        back_populates="budget_scenario", cascade_delete=True
+    )
+
+
+class BudgetSettings(SQLModel, table=True):
+    id: int = Field(default=None, primary_key=True)
+    study_name: str = Field(index=True, foreign_key="budgetscenariosettings.name")
+    channel: str = Field(index=True)
+    initial_budget: float
+    lower_bound: float
+    upper_bound: float
+    budget_scenario: BudgetScenarioSettings = Relationship(back_populates="budget")
+
+
+class BestTrial(SQLModel, table=True):
+    """Best completed trial of a budget scenario, kept current by the optimizer"""
+
+    study_name: str = Field(
+        primary_key=True, foreign_key="budgetscenariosettings.name"
+    )
+    number: int | None = None
+    value: float | None = None
+    budget: dict[str, float] | None = Field(default=None, sa_column=Column(JSON))
+    budget_scenario: BudgetScenarioSettings = Relationship(back_populates="best_trial")
+
+
+class ScenarioBatch(SQLModel, table=True):
+    """Membership of a budget scenario in a batch submitted together"""
+
+    study_name: str = Field(
+        primary_key=True, foreign_key="budgetscenariosettings.name"
+    )
+    batch_id: str = Field(index=True)
+
+
+class FrontierPoint(SQLModel, table=True):
+    """Best allocation found at one total budget of a frontier"""
+
+    study_name: str = Field(
+        primary_key=True, foreign_key="budgetscenariosettings.name"
+    )
+    point: int = Field(primary_key=True)
+    total_budget: float
+    value: float | None = None
+    budget: dict[str, float] | None = Field(default=None, sa_column=Column(JSON))
+    budget_scenario: BudgetScenarioSettings = Relationship(back_populates="frontier")
+
+
+def record_best_trial(
+    session: Session,
+    study_name: str,
+    number: int,
+    value: float,
+    budget: dict[str, float],
+) -> bool:
+    """
+    Store a trial as the best of its scenario unless a better one is stored.
+    The comparison happens in the update so concurrent workers cannot race.
+    """
+    result = session.execute(
+        update(BestTrial)
+        .where(
+            BestTrial.study_name == study_name,
+            or_(BestTrial.value.is_(None), BestTrial.value < value),
+        )
+        .values(number=number, value=value, budget=budget)
+    )
+    session.commit()
+    return result.rowcount > 0
+
+
+def record_frontier_point(
+    session: Session,
+    study_name: str,
+    point: int,
+    value: float,
+    budget: dict[str, float],
+) -> bool:
+    """Store the best allocation of a frontier point unless a better one is stored"""
+    result = session.execute(
+        update(FrontierPoint)
+        .where(
+            FrontierPoint.study_name == study_name,
+            FrontierPoint.point == point,
+            or_(FrontierPoint.value.is_(None), FrontierPoint.value < value),
+        )
+        .values(value=value, budget=budget)
+    )
+    session.commit()
+    return result.rowcount > 0
+
+
+def delete_scenario_statements(name: str) -> list:
+    """Statements deleting the settings and best trial of a scenario, children first"""
+    return [
+        delete(BudgetSettings).where(BudgetSettings.study_name == name),
+        delete(BestTrial).where(BestTrial.study_name == name),
+        delete(ScenarioBatch).where(ScenarioBatch.study_name == name),
+        delete(FrontierPoint).where(FrontierPoint.study_name == name),
+        delete(BudgetScenarioSettings).where(BudgetScenarioSettings.name == name),
+    ]
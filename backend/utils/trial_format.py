@@ -0,0 +1,65 @@
+import gzip
+import io
+
+import brotli
+import optuna
+import pyarrow as pa
+
+from utils.budget_classes import ACCEPTED_CHANNELS
+
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def trials_to_columns(
+    trials: list[optuna.trial.FrozenTrial],
+) -> dict[str, list[int | float | None]]:
+    """
+    Lay trials out as one list per field: trial number, state (the optuna
+    TrialState value), objective and the spend of every channel
+    """
+    columns = {"number": [], "state": [], "objective": []} | {
+        channel: [] for channel in ACCEPTED_CHANNELS
+    }
+    for trial in trials:
+        budget = trial.user_attrs.get("budget", {})
+        columns["number"].append(trial.number)
+        columns["state"].append(trial.state.value)
+        columns["objective"].append(trial.values[0] if trial.values else None)
+        for channel in ACCEPTED_CHANNELS:
+            columns[channel].append(budget.get(channel))
+    return columns
+
+
+def columns_to_arrow(
+    columns: dict[str, list[int | float | None]], metadata: dict[str, str]
+) -> bytes:
+    """Serialize columns as a zstd compressed Arrow IPC stream"""
+    table = pa.table(
+        {
+            "number": pa.array(columns["number"], type=pa.int64()),
+            "state": pa.array(columns["state"], type=pa.int8()),
+        }
+        | {
+            name: pa.array(values, type=pa.float64())
+            for name, values in columns.items()
+            if name not in ("number", "state")
+        }
+    ).replace_schema_metadata(metadata)
+    sink = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def compress(body: bytes, accept_encoding: str) -> tuple[bytes, str | None]:
+    """Compress a response body with the best encoding the client accepts"""
+    encodings = {
+        encoding.split(";")[0].strip() for encoding in accept_encoding.split(",")
+    }
+    if "br" in encodings:
+        return brotli.compress(body), "br"
+    if "gzip" in encodings:
+        return gzip.compress(body), "gzip"
+    return body, None
@@ -0,0 +1,77 @@
+import optuna
+from sqlalchemy import and_, func, or_
+from sqlmodel import select
+
+from utils.allocation import project_budget
+from utils.tables import BestTrial, BudgetSettings
+
+
+def overlapping_scenarios(bounds: dict[str, tuple[float, float]]):
+    """Select the scenarios whose bounds overlap `bounds` in every channel"""
+    return (
+        select(BudgetSettings.study_name)
+        .where(
+            or_(
+                *[
+                    and_(
+                        BudgetSettings.channel == channel.lower().replace(" ", "_"),
+                        BudgetSettings.lower_bound <= high,
+                        BudgetSettings.upper_bound >= low,
+                    )
+                    for channel, (low, high) in bounds.items()
+                ]
+            )
+        )
+        .group_by(BudgetSettings.study_name)
+        .having(func.count() == len(bounds))
+    )
+
+
+def best_allocations(bounds: dict[str, tuple[float, float]]):
+    """
+    Select the study name and best budget of the scenarios that overlap
+    `bounds`, best first
+    """
+    return (
+        select(BestTrial.study_name, BestTrial.budget)
+        .where(
+            BestTrial.study_name.in_(overlapping_scenarios(bounds)),
+            BestTrial.value.is_not(None),
+        )
+        .order_by(BestTrial.value.desc())
+    )
+
+
+def prior_allocations(
+    storage: optuna.storages.BaseStorage,
+    best_budgets: list[tuple[str, dict[str, float]]],
+    model_version: str,
+    bounds: dict[str, tuple[float, float]],
+    total: tuple[float, float],
+    n_best: int,
+) -> tuple[list[dict[str, float]], list[str]]:
+    """
+    The first `n_best` distinct budgets of `best_budgets` from studies run on
+    the same model version, moved into `bounds` and the `total` budget range,
+    and the names of the studies they came from
+    """
+    allocations, sources, seen = [], [], set()
+    for name, budget in best_budgets:
+        if len(allocations) == n_best:
+            break
+        try:
+            study_id = storage.get_study_id_from_name(name)
+        except KeyError:
+            continue
+        if storage.get_study_user_attrs(study_id).get("model_version") != model_version:
+            continue
+        budget = project_budget(budget, bounds, total)
+        if budget is None:
+            continue
+        key = tuple(round(value, 6) for value in budget.values())
+        if key in seen:
+            continue
+        seen.add(key)
+        allocations.append(budget)
+        sources.append(name)
+    return allocations, sources
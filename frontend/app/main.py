@@ -9,17 +9,26 @@ import pandas as pd
 
 from utils.budget_classes import BudgetScenario, ACCEPTED_CHANNELS, Budget
 from utils.study_helpers import (
-    get_study,
+    follow_study,
+    unfollow_study,
     list_studies,
     delete_study,
+    resume_study,
     create_budget_scenario,
     get_study_settings,
     get_prediction,
+    get_trial_frame,
+    get_study_summary,
+    COMPLETE_STATE,
     Trial,
     Study
 )
 from utils.ui import make_radar_chart, make_trial_history_figure, make_parallel_coordinates_plot
 
+# Study views are cached by completed trial count, which changes every rerun
+# while a study runs, so only the latest few entries are kept
+STUDY_CACHE_ENTRIES = 16
+
 
 
 
@@ -47,6 +56,7 @@ if not user_validator():
 
 
 def wrap_delete_study(study_name):
+    unfollow_study(study_name)
     asyncio.run(delete_study(study_name))
     index = st.session_state.studies.index(study_name)
     st.session_state.studies.pop(index)
@@ -55,6 +65,15 @@ def wrap_delete_study(study_name):
     sleep(5)
 
 
+def wrap_resume_study(study_name):
+    if asyncio.run(resume_study(study_name)) is None:
+        st.toast(f"{study_name} could not be resumed")
+        return
+    # The old stream ended when the study was paused, so follow it anew
+    unfollow_study(study_name)
+    st.toast(f"{study_name} resumed")
+
+
 def refresh(study_name):
     st.session_state.studies = asyncio.run(list_studies())
 
@@ -80,38 +99,48 @@ def predict(budget) -> float:
     return prediction["prediction"]
 
 
-@st.cache_data
-def convert_study(study):
+@st.cache_data(ttl=60)
+def cached_study_settings(study_name: str):
+    return asyncio.run(get_study_settings(study_name))
+
+
+@st.cache_data(max_entries=STUDY_CACHE_ENTRIES)
+def convert_study(study_name: str, n_completed: int):
     try:
-        budget = [
-            trial.budget | {"Revenue": trial.values[0]}
-            for trial in study.trials
-            if trial.completed
-        ]
-
-        df = pd.DataFrame(data=budget)
-        return df.to_csv().encode("utf-8")
+        df = asyncio.run(get_trial_frame(study_name))
+        df = df[df["state"] == COMPLETE_STATE]
+        df = df[ACCEPTED_CHANNELS + ["objective"]].rename(
+            columns={"objective": "Revenue"}
+        )
+        return df.reset_index(drop=True).to_csv().encode("utf-8")
     except Exception:
         st.error("Error converting study to csv")
         # print("csv", e)
         return None
 
-@st.cache_data
+@st.cache_data(max_entries=STUDY_CACHE_ENTRIES)
 def cached_radar_chart(
     initial_budget: dict[str, float], 
     optimal_budget: dict[str, float]
 ):
     return make_radar_chart(initial_budget, optimal_budget)
 
-@st.cache_data
-def cached_trial_history_figure(revenue: list[float]):
-    return make_trial_history_figure(revenue=revenue)
+@st.cache_data(max_entries=STUDY_CACHE_ENTRIES)
+def cached_study_summary(study_name: str, n_completed: int):
+    return asyncio.run(get_study_summary(study_name))
 
-@st.cache_resource
-def cached_parallel_coordinates_plot(study: Study):
-    return make_parallel_coordinates_plot(study)
+@st.cache_data(max_entries=STUDY_CACHE_ENTRIES)
+def cached_trial_history_figure(revenue: list[float], best: list[float] | None = None):
+    return make_trial_history_figure(revenue=revenue, best=best)
 
-@st.cache_data
+@st.cache_resource(max_entries=STUDY_CACHE_ENTRIES)
+def cached_parallel_coordinates_plot(
+    study_name: str, n_completed: int, ranges: dict | None, _study: Study
+):
+    # The study itself is not hashed, its name and trial count identify it
+    return make_parallel_coordinates_plot(_study, ranges)
+
+@st.cache_data(max_entries=STUDY_CACHE_ENTRIES)
 def trial_view(
     best_study: Trial | None,
     initial_budget: dict[str, float],
@@ -158,18 +187,19 @@ def trial_view(
         ...
 
 
-@st.fragment(run_every=30)
+@st.fragment(run_every=1)
 def show_study(study_name):
-    study = asyncio.run(get_study(study_name))
+    # Trials arrive through the backend's event stream, so a rerun only
+    # re-renders the local copy of the study
+    stream = follow_study(study_name)
+    study = stream.study
     if not study:
-        sleep(5)
-        st.rerun()
         return
     container = st.container(key=f"{study_name}_container", border=True, height=800)
     container.markdown(f"### {study_name}")
 
     ## Handle study initial settings
-    study_settings = asyncio.run(get_study_settings(study_name))
+    study_settings = cached_study_settings(study_name)
     study_settings = study_settings if study_settings else {}
     if study_settings:
         initial_budget = {
@@ -189,6 +219,11 @@ def show_study(study_name):
             for name in ACCEPTED_CHANNELS
         }
 
+    ## Server side summary, refetched only when more trials have completed
+    n_completed = sum(trial.completed for trial in study.trials)
+    summary = cached_study_summary(study_name, n_completed)
+    summary = summary if summary else {}
+
     ## Handle best trial
     best_study = study.best_trial
     best_study = best_study if best_study else "No best trial yet"
@@ -214,6 +249,14 @@ def show_study(study_name):
         on_click=wrap_delete_study,
         args=(study_name,),
     )
+    columns[-3].button(
+        "Resume",
+        key=f"{study_name}_resume",
+        on_click=wrap_resume_study,
+        args=(study_name,),
+        disabled=stream.state != "paused",
+        help="Continue a paused study",
+    )
     columns[-2].button(
         "Refresh",
         key=f"{study_name}_refresh",
@@ -233,7 +276,7 @@ def show_study(study_name):
 
             columns[0].download_button(
                 "Download",
-                convert_study(study),
+                convert_study(study_name, n_completed),
                 f"{study_name}_trials.csv",
                 key=f"{study_name}_download",
                 mime="text/csv",
@@ -244,7 +287,12 @@ def show_study(study_name):
 
         try:
             ## Display parallel coordinates plot to compare budget allocations
-            fig = cached_parallel_coordinates_plot(study)
+            ranges = summary.get("channels", {}) | {
+                "Revenue": summary.get("objective")
+            }
+            fig = cached_parallel_coordinates_plot(
+                study_name, n_completed, ranges, study
+            )
             st.plotly_chart(fig, use_container_width=False, theme=None)
 
         except ValueError:
@@ -253,8 +301,13 @@ def show_study(study_name):
     with tabs[2]:
         ## Optimizer history for
         try:
-            revenue = [trial.values[0] for trial in study.trials if trial.completed]
-            fig = cached_trial_history_figure(revenue=revenue)
+            if summary.get("running_best"):
+                revenue = summary["running_best"]["value"]
+                best = summary["running_best"]["best"]
+            else:
+                revenue = [trial.values[0] for trial in study.trials if trial.completed]
+                best = None
+            fig = cached_trial_history_figure(revenue=revenue, best=best)
             st.plotly_chart(fig, use_container_width=True)
 
         except Exception as e:
@@ -1,4 +1,5 @@
 from enum import StrEnum
+from typing import Literal
 
 from pydantic import BaseModel, Field, model_validator, create_model
 
@@ -74,11 +75,111 @@ BUDGET_FIELDS = (
             int,
             Field(1000, description="The max number of trials for the optimizer."),
         ),
+        "n_workers": (
+            int,
+            Field(
+                1,
+                description="The number of worker processes running trials in parallel.",
+                ge=1,
+            ),
+        ),
+        "batch_size": (
+            int,
+            Field(
+                1,
+                description="The number of trials each worker scores with one model call.",
+                ge=1,
+            ),
+        ),
+        "user": (
+            str,
+            Field("anonymous", description="The analyst submitting this scenario."),
+        ),
+        "priority": (
+            int,
+            Field(0, description="Scenarios with a higher priority start first."),
+        ),
+        "warm_start": (
+            bool,
+            Field(
+                True,
+                description="Start from the best budgets of similar earlier scenarios.",
+            ),
+        ),
+        "solver": (
+            Literal["tpe", "slsqp", "trust-constr", "surrogate"],
+            Field(
+                "tpe",
+                description="TPE searches any model, SLSQP and trust-constr follow the "
+                "gradient of smooth models, surrogate screens candidates for slow "
+                "models with a Gaussian process.",
+            ),
+        ),
+        "sampling": (
+            Literal["sequential", "simplex"],
+            Field(
+                "sequential",
+                description="How TPE proposes budgets: channel by channel, or as a "
+                "total and channel weights that always meet the bounds.",
+            ),
+        ),
+        "plateau_window": (
+            int | None,
+            Field(
+                None,
+                description="Stop once the best value improved by less than the "
+                "plateau tolerance over this many trials.",
+                ge=1,
+            ),
+        ),
+        "plateau_tolerance": (
+            float,
+            Field(
+                1e-4,
+                description="The relative improvement that counts as a plateau.",
+                ge=0,
+            ),
+        ),
+        "target_value": (
+            float | None,
+            Field(None, description="Stop once the best value reaches this value."),
+        ),
+        "stagnation_trials": (
+            int | None,
+            Field(
+                None,
+                description="Stop once the Optuna terminator sees this many trials "
+                "without a new best value.",
+                ge=1,
+            ),
+        ),
+        "model_version": (
+            str | None,
+            Field(
+                None,
+                description="The model version to optimize, the active model if empty.",
+            ),
+        ),
     }
 )
 
 BudgetScenario = create_model("BudgetScenario", **BUDGET_FIELDS)
 
+# A frontier solves the scenario at `n_points` total budgets spread evenly
+# over the total budget bounds, sharing `n_trials` between the points
+FrontierScenario = create_model(
+    "FrontierScenario",
+    __base__=BudgetScenario,
+    n_points=(
+        int,
+        Field(
+            10,
+            description="The number of total budgets between the total budget bounds.",
+            ge=2,
+        ),
+    ),
+)
+
 # class BudgetScenario(BaseModel):
 
 #     name: str = Field(
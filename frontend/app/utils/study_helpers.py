@@ -1,10 +1,15 @@
 import httpx
 from dataclasses import dataclass
 import numpy as np
+import pandas as pd
+import pyarrow as pa
 #from dotenv import load_dotenv
 from utils.budget_classes import BudgetScenario, Budget
+import asyncio
+import json
 import os
-from typing import TypedDict
+import threading
+from typing import Iterator, TypedDict
 
 
 class PredictionResponse(TypedDict):
@@ -18,11 +23,18 @@ BUDGET_URL = f"{BASE_URL}/budget_scenario"
 PREDICTION_URL = f"{BASE_URL}/predict"
 
 
+TRIAL_PAGE_SIZE = 1000
+COMPLETE_STATE = 1  # optuna TrialState.COMPLETE
+UNFINISHED_STATES = (0, 4)  # optuna TrialState.RUNNING and TrialState.WAITING
+
+
 @dataclass
 class Trial:
     budget: dict[str, float]
     values: list[float]
     completed: bool
+    number: int = -1
+    running: bool = False
 
 
 @dataclass
@@ -34,34 +46,124 @@ class Study:
     def best_trial(self):
         if len(self.trials) < 1:
             return None
-        return sorted(
-            self.trials, key=lambda x: x.values[0] if x.completed else -np.inf
-        )[-1]
+        return max(self.trials, key=lambda x: x.values[0] if x.completed else -np.inf)
+
+    @property
+    def refresh_cursor(self) -> int:
+        """Trials numbered above this one may still change on the backend"""
+        running = [trial.number for trial in self.trials if trial.running]
+        if running:
+            return min(running) - 1
+        return max((trial.number for trial in self.trials), default=-1)
+
+
+_STUDIES: dict[str, Study] = {}
 
 
-def process_study(study: dict[str, list[dict[str, any]]]) -> Study:
-    """Process the response from the API to a study object"""
+def process_study(
+    study: dict[str, list[dict[str, any]]], cached: Study | None = None
+) -> Study:
+    """
+    Process the response from the API to a study object, merging the
+    returned trials into a previously fetched study
+    """
 
+    study = {key: value for key, value in study.items() if key != "next_cursor"}
     assert len(study.keys()) == 1, "Only one study is allowed"
     name = list(study.keys())[0]
-    trial_objects = []
+    trial_objects = {trial.number: trial for trial in cached.trials} if cached else {}
     try:
         for trial in study[name]:
-            trial_objects.append(
-                Trial(
-                    budget=trial["_user_attrs"]["budget"],
-                    values=trial["_values"],
-                    completed=trial["state"] == 1,
-                )
+            trial_objects[trial["_number"]] = Trial(
+                budget=trial["_user_attrs"].get("budget", {}),
+                values=trial["_values"],
+                completed=trial["state"] == COMPLETE_STATE,
+                number=trial["_number"],
+                running=trial["state"] in UNFINISHED_STATES,
             )
     except KeyError:
         print("Error processing study")
         return Study(name=name, trials=[Trial(budget={}, values=[], completed=False)])
-    return Study(name=name, trials=trial_objects)
+    return Study(
+        name=name, trials=[trial_objects[number] for number in sorted(trial_objects)]
+    )
 
 
-async def get_study(study_name: str, url: str = BUDGET_URL) -> Study:
+async def get_study(
+    study_name: str, url: str = BUDGET_URL, page_size: int = TRIAL_PAGE_SIZE
+) -> Study:
+    """
+    Get a study, only downloading the trials that are new or were still
+    running when it was last fetched
+    """
     formated_url = f"{url}/{study_name}"
+    study = _STUDIES.get(study_name)
+    cursor = study.refresh_cursor if study else -1
+    try:
+        async with httpx.AsyncClient() as client:
+            while cursor is not None:
+                response = await client.get(
+                    formated_url, params={"cursor": cursor, "limit": page_size}
+                )
+                response.raise_for_status()
+                page = response.json()
+                study = process_study(page, study)
+                cursor = page["next_cursor"]
+    except httpx.RequestError as exc:
+        print(f"A request error occurred: {exc}")
+        return None
+    except httpx.TimeoutException as exc:
+        print(f"A timeout error occurred: {exc}")
+        return None
+    except httpx.HTTPStatusError as exc:
+        print(f"A HTTP status error occurred: {exc}")
+        if exc.response.status_code == 404:
+            print(f"Study {study_name} not found")
+            _STUDIES.pop(study_name, None)
+        return None
+    except httpx.HTTPError as exc:
+        print(f"An error occurred: {exc}")
+        return None
+
+    _STUDIES[study_name] = study
+    return study
+
+
+async def get_trial_frame(
+    study_name: str, url: str = BUDGET_URL, since_trial_number: int = -1
+) -> pd.DataFrame | None:
+    """
+    Get the trials of a study as a DataFrame with one column per channel plus
+    number, state and objective, decoded straight from an Arrow IPC stream
+    """
+    formated_url = f"{url}/{study_name}"
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(
+                formated_url,
+                params={"format": "arrow", "since_trial_number": since_trial_number},
+            )
+        response.raise_for_status()
+    except httpx.RequestError as exc:
+        print(f"A request error occurred: {exc}")
+        return None
+    except httpx.TimeoutException as exc:
+        print(f"A timeout error occurred: {exc}")
+        return None
+    except httpx.HTTPStatusError as exc:
+        print(f"A HTTP status error occurred: {exc}")
+        if exc.response.status_code == 404:
+            print(f"Study {study_name} not found")
+        return None
+    except httpx.HTTPError as exc:
+        print(f"An error occurred: {exc}")
+        return None
+
+    return pa.ipc.open_stream(response.content).read_pandas()
+
+
+async def get_study_summary(study_name: str, url: str = BUDGET_URL):
+    formated_url = f"{url}/{study_name}/summary"
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get(formated_url)
@@ -81,7 +183,7 @@ async def get_study(study_name: str, url: str = BUDGET_URL) -> Study:
         print(f"An error occurred: {exc}")
         return None
 
-    return process_study(response.json())
+    return response.json()
 
 
 async def get_study_settings(study_name: str, url: str = BUDGET_URL):
@@ -131,6 +233,7 @@ async def list_studies(url: str = BUDGET_URL) -> list[str]:
 
 async def delete_study(study_name: str, url: str = BUDGET_URL) -> None:
     formated_url = f"{url}/{study_name}"
+    _STUDIES.pop(study_name, None)
     try:
         async with httpx.AsyncClient() as client:
             response = await client.delete(formated_url)
@@ -170,6 +273,27 @@ async def create_budget_scenario(data: BudgetScenario, url: str = BUDGET_URL) ->
         return None
 
 
+async def resume_study(study_name: str, url: str = BUDGET_URL) -> dict | None:
+    formated_url = f"{url}/{study_name}/resume"
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(formated_url)
+        response.raise_for_status()
+        return response.json()
+    except httpx.RequestError as exc:
+        print(f"A request error occurred: {exc}")
+        return None
+    except httpx.TimeoutException as exc:
+        print(f"A timeout error occurred: {exc}")
+        return None
+    except httpx.HTTPStatusError as exc:
+        print(f"A HTTP status error occurred: {exc}")
+        return None
+    except httpx.HTTPError as exc:
+        print(f"An error occurred: {exc}")
+        return None
+
+
 async def get_prediction(
     budget: Budget, url: str = PREDICTION_URL
 ) -> PredictionResponse | None:
@@ -190,3 +314,118 @@ async def get_prediction(
     except httpx.HTTPError as exc:
         print(f"An error occurred: {exc}")
         return None
+
+
+def _iter_sse(lines: Iterator[str]) -> Iterator[dict[str, str]]:
+    """Parse Server-Sent Events into dicts of their fields"""
+    event = {}
+    for line in lines:
+        if not line:
+            if "data" in event:
+                yield event
+            event = {}
+        elif not line.startswith(":"):
+            field, _, value = line.partition(":")
+            event[field] = value.removeprefix(" ")
+
+
+# Events after which a scenario sends nothing more until it is resumed
+TERMINAL_EVENTS = ("done", "error", "deleted", "paused", "cancelled")
+
+
+class StudyStream:
+    """
+    Keeps a local copy of a study up to date by following its event stream
+    in a background thread, until the scenario finishes or stops
+    """
+
+    def __init__(self, study_name: str, url: str = BUDGET_URL):
+        self.study_name = study_name
+        self.url = url
+        self.study: Study | None = None
+        self.finished = False
+        self.state: str | None = None
+        self._trials: dict[int, Trial] = {}
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def _merge(self, trials: list[Trial]) -> None:
+        for trial in trials:
+            if trial.number >= 0:
+                self._trials[trial.number] = trial
+        self.study = Study(
+            name=self.study_name,
+            trials=[self._trials[number] for number in sorted(self._trials)],
+        )
+
+    def _apply(self, event: str, data: dict) -> None:
+        if event == "trial":
+            self._merge(
+                [
+                    Trial(
+                        budget=data["budget"],
+                        values=data["values"] or [],
+                        completed=data["completed"],
+                        number=data["number"],
+                    )
+                ]
+            )
+        elif event in TERMINAL_EVENTS:
+            self.state = event
+            self.finished = True
+
+    def _run(self) -> None:
+        study = asyncio.run(get_study(self.study_name, self.url))
+        if study:
+            self._merge(study.trials)
+
+        last_id = -1
+        while not self.closed and not self.finished:
+            try:
+                with httpx.stream(
+                    "GET",
+                    f"{self.url}/{self.study_name}/events",
+                    params={"since": last_id},
+                    timeout=httpx.Timeout(5, read=60),
+                ) as response:
+                    if response.status_code == 404:
+                        # Not running on the backend, so the stored trials are final
+                        self.finished = True
+                        return
+                    response.raise_for_status()
+                    for event in _iter_sse(response.iter_lines()):
+                        last_id = int(event.get("id", last_id))
+                        self._apply(event.get("event"), json.loads(event["data"]))
+                        if self.closed:
+                            return
+            except httpx.HTTPError as exc:
+                print(f"Event stream for {self.study_name} interrupted: {exc}")
+                self._closed.wait(5)
+
+
+_STREAMS: dict[str, StudyStream] = {}
+_STREAMS_LOCK = threading.Lock()
+
+
+def follow_study(study_name: str, url: str = BUDGET_URL) -> StudyStream:
+    """Return the shared stream for a study, starting it if needed"""
+    with _STREAMS_LOCK:
+        stream = _STREAMS.get(study_name)
+        if stream is None or stream.closed:
+            stream = _STREAMS[study_name] = StudyStream(study_name, url)
+        return stream
+
+
+def unfollow_study(study_name: str) -> None:
+    with _STREAMS_LOCK:
+        stream = _STREAMS.pop(study_name, None)
+    if stream is not None:
+        stream.close()
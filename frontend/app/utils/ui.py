@@ -57,13 +57,15 @@ def make_radar_chart(initial_budget: Budget, optimized_budget: Budget) -> go.Fig
     return fig
 
 
-def make_trial_history_figure(revenue: list[float]) -> go.Figure:
-    best_studys = []
-    best_so_far = 0
-    for trial in revenue:
-        if trial > best_so_far:
-            best_so_far = trial
-        best_studys.append(best_so_far)
+def make_trial_history_figure(
+    revenue: list[float], best: list[float] | None = None
+) -> go.Figure:
+    revenue = np.asarray(revenue, dtype=float)
+    best_studys = (
+        np.maximum.accumulate(np.maximum(revenue, 0))
+        if best is None
+        else np.asarray(best, dtype=float)
+    )
 
     index = np.arange(len(revenue))
 
@@ -94,8 +96,13 @@ def make_trial_history_figure(revenue: list[float]) -> go.Figure:
 
     return fig
 
-def make_parallel_coordinates_plot(study: Study) -> go.Figure:
-    """Make a parallel coordinates plot of the study"""
+def make_parallel_coordinates_plot(
+    study: Study, ranges: dict[str, dict[str, float]] | None = None
+) -> go.Figure:
+    """
+    Make a parallel coordinates plot of the study. Axis ranges are taken from
+    `ranges` (the channel and objective ranges of the study summary) when given.
+    """
     if len(study.trials) < 1:
         return go.Figure()
 
@@ -104,32 +111,28 @@ def make_parallel_coordinates_plot(study: Study) -> go.Figure:
     if len(trials) < 1:
         return go.Figure()
 
-    data = []
-    for trial in trials:
-        data.append([trial.budget[cat] for cat in categories] + trial.values)
+    values = np.array([[trial.budget[cat] for cat in categories] + trial.values[:1] for trial in trials])
+    ranges = ranges or {}
+    labels = categories + ["Revenue"]
+    dimensions = []
+    for i, label in enumerate(labels):
+        column_range = ranges.get(label) or {"min": values[:, i].min(), "max": values[:, i].max()}
+        dimensions.append(
+            dict(
+                label=label,
+                values=values[:, i],
+                range=[np.floor(column_range["min"]), np.ceil(column_range["max"])],
+            )
+        )
 
     fig = go.Figure(
         data=[
             go.Parcoords(
                 line=dict(
-                    color=[trial.values[0] for trial in trials],
+                    color=values[:, -1],
                     colorscale="blues",
                     showscale=True,),
-                dimensions=[
-                    dict(
-                        label=cat,
-                        values=[trial.budget[cat] for trial in trials],
-                        range=[np.floor(min([trial.budget[cat] for trial in trials])), np.ceil(max([trial.budget[cat] for trial in trials]))],
-                    )
-                    for cat in categories
-                ]
-                + [
-                    dict(
-                        label="Revenue",
-                        values=[trial.values[0] for trial in trials],
-                        range=[np.floor(min([trial.values[0] for trial in trials])), np.ceil(max([trial.values[0] for trial in trials]))],
-                    )
-                ],
+                dimensions=dimensions,
             )
         ],
 